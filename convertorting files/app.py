@@ -1,15 +1,37 @@
 import os
-from flask import Flask, request, jsonify, render_template, send_from_directory
+import re
+from flask import Flask, Request, request, jsonify, render_template, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, select, update, delete, bindparam
+from sqlalchemy.orm import selectinload, joinedload, raiseload, load_only, scoped_session, aliased
 from dotenv import load_dotenv
 from datetime import datetime, timezone
 import uuid
+from urllib.parse import unquote
+import shutil
+import hashlib
+import sqlite3
 import logging
+import queue
+import threading
+import time
+import atexit
+from contextlib import contextmanager
 import concurrent.futures
+import multiprocessing
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
-from convertor.core import process_file # Import the processing function
+from convertor.core import process_file, prune_cache # Import the processing function
 from convertor.file_splitter import split_file, should_split_file, cleanup_temp_files # Import file splitting functions
 
+# orjson je volitelný - pokud chybí, JSON odpovědi serializuje standardní modul json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Load environment variables (e.g., for API keys)
 load_dotenv()
 
@@ -33,7 +55,12 @@ if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
 # Parse allowed extensions from environment variable
-ALLOWED_EXTENSIONS = os.environ.get('ALLOWED_EXTENSIONS', 'pdf,docx,doc,txt,jpg,jpeg,png').split(',')
+# Výchozí seznam odpovídá formátům, které umí zpracovat convertor.core.process_file (a atributu accept ve formuláři)
+ALLOWED_EXTENSIONS = frozenset(
+    ext.strip().lower().lstrip('.')
+    for ext in os.environ.get('ALLOWED_EXTENSIONS', 'txt,pdf,docx,doc,odt,html,htm,xlsx,xls,csv,json,png,jpg,jpeg,webp,gif,bmp').split(',')
+    if ext.strip()
+)
 
 # --- App Initialization ---
 # Configure logging for Flask app
@@ -55,6 +82,7 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 100 * 1024 * 1024))  # Default: 100MB
 app.config['MAX_WORKERS'] = int(os.environ.get('MAX_WORKERS', 4))  # Default: 4 workers
+app.config['UPLOAD_BUFFER_SIZE'] = int(os.environ.get('UPLOAD_BUFFER_SIZE', 1024 * 1024))  # Default: 1MB buffer pro ukládání souborů
 app.config['FLASK_ENV'] = os.environ.get('FLASK_ENV', 'development')
 app.config['FLASK_DEBUG'] = os.environ.get('FLASK_DEBUG', '1') == '1'
 
@@ -63,10 +91,136 @@ if os.environ.get('RATE_LIMIT_WINDOW_MS') and os.environ.get('RATE_LIMIT_MAX_REQ
     app.config['RATE_LIMIT_WINDOW_MS'] = int(os.environ.get('RATE_LIMIT_WINDOW_MS'))
     app.config['RATE_LIMIT_MAX_REQUESTS'] = int(os.environ.get('RATE_LIMIT_MAX_REQUESTS'))
 
+# Nastavení SQLite spojení - spojení sdílí vlákna z thread poolu, proto vypneme kontrolu vlákna
+# a velikost poolu přizpůsobíme počtu workerů. Při souběžných zápisech workerů čeká spojení
+# na zámek až 30 s (timeout) místo okamžité chyby "database is locked".
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite:///'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'connect_args': {'check_same_thread': False, 'timeout': 30},
+        'pool_size': app.config['MAX_WORKERS'] + 1  # Workery + vlákno obsluhující požadavky
+    }
+
+class IsoJSONProvider(DefaultJSONProvider):
+    """
+    Výchozí JSON provider, který datetime serializuje v ISO 8601 (stejně jako orjson).
+
+    Modely a endpointy tak mohou předávat datetime přímo bez volání isoformat().
+    SQLite vrací časy bez časové zóny, ale ukládáme je vždy v UTC - naivní datetime
+    proto serializujeme s posunem +00:00, aby je klient nepovažoval za místní čas.
+    """
+    @staticmethod
+    def default(o):
+        if isinstance(o, datetime):
+            if o.tzinfo is None:
+                o = o.replace(tzinfo=timezone.utc)
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+class OrjsonProvider(IsoJSONProvider):
+    """
+    JSON provider pro jsonify() využívající orjson (serializace v nativním kódu).
+
+    Velké výpisy dokumentů se tak nekódují čistě pythonovskou smyčkou modulu json.
+    datetime serializuje orjson nativně (naivní jako UTC); typy, které nezná, předává do default().
+    """
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC if ORJSON_AVAILABLE else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.OPTIONS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self.OPTIONS
+        if self.compact is None and self._app.debug:
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=option),
+            mimetype=self.mimetype
+        )
+
+app.json = OrjsonProvider(app) if ORJSON_AVAILABLE else IsoJSONProvider(app)
+
 db = SQLAlchemy(app)
 
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Nastaví SQLite pragmy pro každé nové spojení.
+
+    WAL umožňuje čtení souběžně se zápisem, synchronous=NORMAL ve WAL režimu
+    odstraní polovinu fsync volání a mmap/cache_size drží horké stránky v paměti.
+    busy_timeout nechá SQLite při souběžném zápisu počkat na uvolnění zámku.
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA busy_timeout=30000")  # 30 s
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256MB
+    cursor.execute("PRAGMA cache_size=-65536")  # 64MB
+    cursor.close()
+
+# Pragmy registrujeme jen pro engine této aplikace, ne pro všechny SQLAlchemy enginy v procesu
+with app.app_context():
+    event.listen(db.engine, "connect", set_sqlite_pragmas)
+
 # Create a thread pool executor for file processing
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=app.config['MAX_WORKERS'])
+# Omezený pool se sdílí všemi nahráváními - pro jednotlivé soubory se nevytvářejí nová vlákna
+executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=app.config['MAX_WORKERS'],
+    thread_name_prefix='processing'
+)
+
+# Jednovláknový executor pro mazání souborů z disku - požadavek na smazání dokumentu nečeká
+# na rmtree/unlink a mazání se nezařadí za dlouhé úlohy zpracování v hlavním poolu
+file_cleanup_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='file-cleanup')
+
+# Process pool pro samotné parsování souborů (PDF/OCR/DOCX), které je CPU náročné a ve vláknech
+# by se serializovalo na GIL. Vlákna z thread poolu jen orchestrují práci a zapisují do DB.
+# Používáme 'spawn', aby se nefork-oval proces s běžícími vlákny. Pool se vytváří až při prvním
+# použití - workery při 'spawn' znovu importují tento modul (jako __mp_main__) a nemají si
+# zakládat vlastní pool.
+process_executor = None
+process_executor_lock = threading.Lock()
+
+def get_process_executor(broken=None):
+    """
+    Vrátí sdílený process pool, případně ho vytvoří.
+
+    Pokud je předán rozbitý pool (broken) a je stále aktuální, nahradí se novým - pád jednoho
+    workeru (OOM, segfault, kill) tak nevyřadí zpracování souborů pro celý server.
+    """
+    global process_executor
+    with process_executor_lock:
+        if process_executor is None or process_executor is broken:
+            if broken is not None:
+                app_logger.warning("Process pool je rozbitý (pád workeru) - vytvářím nový.")
+                broken.shutdown(wait=False, cancel_futures=True)
+            process_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=app.config['MAX_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return process_executor
+
+def run_in_process_pool(func, *args):
+    """Spustí funkci v process poolu a počká na výsledek; při rozbitém poolu ho obnoví a zkusí to jednou znovu."""
+    pool = get_process_executor()
+    try:
+        return pool.submit(func, *args).result()
+    except concurrent.futures.process.BrokenProcessPool:
+        return get_process_executor(broken=pool).submit(func, *args).result()
+
+# Délka náhledu obsahu ve výpisech dokumentů
+CONTENT_PREVIEW_CHARS = 200
+
+# Cache sloupcové části Folder.to_dict() podle (id, updated_at) - každá změna složky mění updated_at,
+# takže se neplatné položky nikdy nepoužijí; počty dokumentů a podsložek se do cache neukládají
+FOLDER_DICT_CACHE_SIZE = 4096
+folder_dict_cache = {}
 
 # --- Database Models ---
 class Folder(db.Model):
@@ -80,33 +234,65 @@ class Folder(db.Model):
     folder_type = db.Column(db.String(50), default='general', index=True)  # 'email', 'know_how', 'general'
 
     # Vztahy
-    documents = db.relationship('UserDocument', backref='folder', lazy='dynamic')
-    subfolders = db.relationship('Folder', backref=db.backref('parent_folder', remote_side=[id]), lazy='dynamic')
+    documents = db.relationship('UserDocument', backref='folder')
+    subfolders = db.relationship('Folder', backref=db.backref('parent_folder', remote_side=[id]))
 
     def __repr__(self):
         return f'<Folder {self.id}: {self.name} ({self.folder_type})>'
 
-    def to_dict(self):
-        """Převede složku na slovník pro JSON odpověď."""
-        return {
-            'id': self.id,
-            'name': self.name,
-            'description': self.description,
-            'parent_id': self.parent_id,
-            'folder_type': self.folder_type,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
-            'document_count': self.documents.count(),
-            'subfolder_count': self.subfolders.count()
-        }
+    def to_dict(self, counts=None):
+        """
+        Převede složku na slovník pro JSON odpověď.
+
+        Args:
+            counts: Volitelný slovník z get_folder_counts(); pokud chybí, počty se načtou pro tuto složku
+        """
+        if counts is None:
+            counts = get_folder_counts([self.id])
+        folder_counts = counts.get(self.id, {})
+
+        cache_key = (self.id, self.updated_at)
+        columns = folder_dict_cache.get(cache_key)
+        if columns is None:
+            columns = {
+                'id': self.id,
+                'name': self.name,
+                'description': self.description,
+                'parent_id': self.parent_id,
+                'folder_type': self.folder_type,
+                'created_at': self.created_at,
+                'updated_at': self.updated_at
+            }
+            if len(folder_dict_cache) >= FOLDER_DICT_CACHE_SIZE:
+                folder_dict_cache.clear()
+            folder_dict_cache[cache_key] = columns
+
+        result = dict(columns)
+        result['document_count'] = folder_counts.get('document_count', 0)
+        result['subfolder_count'] = folder_counts.get('subfolder_count', 0)
+        return result
 
 class UserDocument(db.Model):
+    # Složené indexy odpovídající filtrům a řazení v list_documents (umožní ORDER BY upload_time bez třídění)
+    __table_args__ = (
+        db.Index('ix_user_document_list', 'parent_id', 'folder_id', 'upload_time'),
+        db.Index('ix_user_document_parent_time', 'parent_id', 'upload_time'),
+        db.Index('ix_user_document_status_time', 'status', 'upload_time'),
+        db.Index('ix_user_document_content_type_time', 'content_type', 'upload_time'),
+        # Filtr složky při výpisu včetně částí (show_parts=true) - bez podmínky na parent_id
+        db.Index('ix_user_document_folder_time', 'folder_id', 'upload_time'),
+        # Části rozděleného dokumentu se vždy načítají seřazené podle part_number
+        db.Index('ix_user_document_parent_part', 'parent_id', 'part_number'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     original_filename = db.Column(db.String(255), nullable=False)
     stored_filename = db.Column(db.String(255), unique=True, nullable=False) # UUID or secure name
     upload_time = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)  # Indexujeme pro rychlé řazení
     status = db.Column(db.String(50), default='pending', index=True) # e.g., pending, processing, completed, error, warning
-    processed_content = db.Column(db.Text, nullable=True)
+    # Plný obsah (může mít i několik MB) se načítá až při přístupu; výpisy používají content_preview
+    processed_content = db.deferred(db.Column(db.Text, nullable=True))
+    content_preview = db.Column(db.String(CONTENT_PREVIEW_CHARS + 3), nullable=True)  # Zkrácený obsah pro náhled
     error_message = db.Column(db.Text, nullable=True)
     # Nové sloupce pro rozdělené soubory
     is_split = db.Column(db.Boolean, default=False, index=True) # Označuje, zda byl soubor rozdělen na části
@@ -117,12 +303,13 @@ class UserDocument(db.Model):
     # Nové sloupce pro kategorizaci a třídění
     content_type = db.Column(db.String(50), default='unknown', index=True)  # 'email', 'know_how', 'general', 'unknown'
     folder_id = db.Column(db.Integer, db.ForeignKey('folder.id'), nullable=True, index=True)  # Odkaz na složku
-    tags = db.Column(db.String(500), nullable=True)  # Tagy oddělené čárkami
+    tags = db.Column(db.JSON, nullable=True)  # Seznam tagů (JSON pole) - serializuje se bez dalšího zpracování
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 obsahu souboru pro deduplikaci
     # user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # Add later with user auth
 
     # Vztah pro přístup k částem rozděleného souboru
     parts = db.relationship('UserDocument', backref=db.backref('parent', remote_side=[id]),
-                           lazy='dynamic')
+                           order_by='UserDocument.part_number')
 
     def __repr__(self):
         if self.is_split:
@@ -138,19 +325,16 @@ class UserDocument(db.Model):
             'id': self.id,
             'original_filename': self.original_filename,
             'status': self.status,
-            'upload_time': self.upload_time.isoformat(),
+            'upload_time': self.upload_time,
             'content_type': self.content_type,
             'folder_id': self.folder_id,
-            'tags': self.tags.split(',') if self.tags else []
+            'tags': self.tags or []
         }
 
         if self.status in ['completed', 'warning']:
             # Přidáme zkrácenou verzi obsahu pro náhled
-            if self.processed_content:
-                if len(self.processed_content) > 200:
-                    result['content_preview'] = self.processed_content[:200] + '...'
-                else:
-                    result['content_preview'] = self.processed_content
+            if self.content_preview:
+                result['content_preview'] = self.content_preview
 
         if self.error_message:
             result['error_message'] = self.error_message
@@ -167,75 +351,297 @@ class UserDocument(db.Model):
 
         return result
 
+# --- Content Type Detection ---
+# Klíčová slova pro detekci typu obsahu - předkompilovaná do jednoho regulárního výrazu,
+# aby se dokument prošel jedním průchodem místo samostatného hledání každého slova
+EMAIL_KEYWORDS = ['od:', 'odesílatel:', 'from:', 'komu:', 'to:', 'předmět:', 'subject:']
+COMPANY_KNOW_HOW_KEYWORDS = ['postup', 'návod', 'how to', 'guide', 'tutorial', 'dokumentace',
+                             'documentation', 'firemní', 'společnost', 'proces', 'procedura',
+                             'personální', 'zaměstnanec', 'pracovník', 'mzda', 'plat', 'dovolená',
+                             'školení', 'nábor', 'pohovor', 'hr', 'human resources']
+
+EMAIL_KEYWORDS_RE = re.compile('|'.join(map(re.escape, EMAIL_KEYWORDS)), re.IGNORECASE)
+COMPANY_KNOW_HOW_KEYWORDS_RE = re.compile('|'.join(map(re.escape, COMPANY_KNOW_HOW_KEYWORDS)), re.IGNORECASE)
+
+# JSON výstup emailového parseru (emails_to_json) začíná objektem s klíči "type"/"emails";
+# mezery kolem dvojtečky připouštíme kvůli odsazenému výstupu
+EMAIL_JSON_SIGNATURE_RE = re.compile(r'\s*\{[^}]*?(?:"type"\s*:\s*"email_correspondence"|"emails"\s*:)')
+EMAIL_JSON_SIGNATURE_CHARS = 512
+
+# Typ obsahu se určuje jen podle začátku dokumentu (hlavičky emailů, nadpisy, úvod návodu);
+# procházet celý - i několik MB dlouhý - text nemá smysl
+CONTENT_TYPE_SCAN_CHARS = 8192
+
 # --- Helper Functions ---
-def detect_content_type(document):
+def get_file_extension(filename):
+    """Vrátí příponu souboru malými písmeny bez tečky (prázdný řetězec, pokud přípona chybí)."""
+    _, dot, ext = filename.rpartition('.')
+    return ext.lower() if dot else ''
+
+def make_unique_filename(file_extension):
+    """Vygeneruje jedinečný název souboru pro uložení v UPLOAD_FOLDER."""
+    return f"{uuid.uuid4()}.{file_extension}" if file_extension else str(uuid.uuid4())
+
+def save_file_stream(stream, save_path, buffer_size):
     """
-    Detekuje typ obsahu dokumentu na základě jeho zpracovaného obsahu a přiřadí ho do odpovídající složky.
+    Uloží stream do souboru a během zápisu spočítá SHA-256 hash obsahu.
 
     Args:
-        document: Instance modelu UserDocument
+        stream: Zdrojový stream (např. FileStorage.stream)
+        save_path: Cílová cesta souboru
+        buffer_size: Velikost bufferu pro čtení a zápis
+
+    Returns:
+        str: Hexadecimální SHA-256 hash uloženého obsahu
     """
-    if not document.processed_content:
-        document.content_type = 'unknown'
-        return
+    file_hash = hashlib.sha256()
+    # Bloky zapisujeme přímo (bez bufferu BufferedWriter) - mají už velikost buffer_size
+    with open(save_path, 'wb', buffering=0) as out_file:
+        while chunk := stream.read(buffer_size):
+            file_hash.update(chunk)
+            out_file.write(chunk)
+    return file_hash.hexdigest()
+
+@contextmanager
+def no_expire_on_commit(session):
+    """
+    Dočasně vypne expire_on_commit, aby čtení atributů po commitu (např. při sestavení odpovědi)
+    nevyvolalo nový SELECT - hodnoty jsme právě sami zapsali.
 
-    content = document.processed_content.lower()
+    Nehodí se pro objekty s časovými sloupci plněnými při flush (default/onupdate) - v paměti by
+    zůstala hodnota s časovou zónou místo naivní hodnoty načtené ze SQLite.
+
+    Args:
+        session: Session nebo scoped_session (např. db.session)
+    """
+    session = session() if isinstance(session, scoped_session) else session
+    old_expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        yield session
+    finally:
+        session.expire_on_commit = old_expire_on_commit
 
-    # Detekce emailové korespondence
-    if content.startswith('{') and ('type":"email_correspondence"' in content or '"emails":' in content) or \
-       any(keyword in content for keyword in ['od:', 'odesílatel:', 'from:', 'komu:', 'to:', 'předmět:', 'subject:']):
-        document.content_type = 'email'
-        app_logger.info(f"Detected email correspondence in document ID {document.id}")
+def make_content_preview(content):
+    """Vrátí zkrácenou verzi obsahu pro náhled ve výpisech (None pro prázdný obsah)."""
+    if not content:
+        return None
+    if len(content) > CONTENT_PREVIEW_CHARS:
+        return content[:CONTENT_PREVIEW_CHARS] + '...'
+    return content
 
-        # Automatické přiřazení do složky pro emaily
+def remove_paths(file_paths=(), folder_paths=()):
+    """
+    Smaže soubory a složky (se vším obsahem); chybějící cesty jen zaloguje.
+
+    Mažeme rovnou bez předchozí kontroly os.path.exists - jeden syscall místo dvou a bez závodu
+    mezi kontrolou a smazáním.
+    """
+    for path in file_paths:
         try:
-            email_folder = Folder.query.filter_by(folder_type='email').first()
-            if email_folder:
-                document.folder_id = email_folder.id
-                app_logger.info(f"Automatically assigned document ID {document.id} to email folder ID {email_folder.id}")
-        except Exception as e:
-            app_logger.error(f"Error assigning document to email folder: {e}")
+            os.unlink(path)
+            app_logger.info(f"Deleted file: {path}")
+        except FileNotFoundError:
+            app_logger.warning(f"File not found for deletion: {path}")
+        except OSError as e:
+            app_logger.error(f"Error deleting file {path}: {e}")
+
+    for path in folder_paths:
+        try:
+            shutil.rmtree(path)
+            app_logger.info(f"Deleted folder: {path}")
+        except FileNotFoundError:
+            app_logger.warning(f"Folder not found for deletion: {path}")
+        except OSError as e:
+            app_logger.error(f"Error deleting folder {path}: {e}")
+
+class HashingUploadFile:
+    """
+    Cílový soubor v UPLOAD_FOLDER, do kterého parser multipart formuláře zapisuje nahraný soubor
+    přímo (bez mezikopie přes SpooledTemporaryFile) a zároveň počítá SHA-256 hash obsahu.
+    """
+
+    def __init__(self, save_path):
+        self.save_path = save_path
+        self.claimed = False  # Nastaví upload_files po vytvoření DB záznamu
+        self._file = open(save_path, 'w+b')
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def __getattr__(self, name):
+        # read/seek/close apod. delegujeme na otevřený soubor
+        return getattr(self._file, name)
+
+class UploadRequest(Request):
+    """
+    Request, jehož parser formuláře ukládá soubory pro /api/upload rovnou na cílové místo v UPLOAD_FOLDER.
+
+    Soubory, které upload_files nepřevezme (chyba při registraci, jiné pole formuláře),
+    se po skončení požadavku smažou.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint == 'upload_files' and filename:
+            file_extension = get_file_extension(secure_filename(filename))
+            if file_extension in ALLOWED_EXTENSIONS:
+                save_path = os.path.join(app.config['UPLOAD_FOLDER'], make_unique_filename(file_extension))
+                upload_file = HashingUploadFile(save_path)
+                self.__dict__.setdefault('_upload_files', []).append(upload_file)
+                return upload_file
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+    def close(self):
+        super().close()
+        unclaimed = [f.save_path for f in self.__dict__.get('_upload_files', ()) if not f.claimed]
+        if unclaimed:
+            remove_paths(file_paths=unclaimed)
+
+app.request_class = UploadRequest
+
+def find_processed_duplicate(content_hash):
+    """
+    Najde již úspěšně zpracovaný dokument se stejným obsahem.
+
+    Returns:
+        Row (id, processed_content, content_preview, content_type, folder_id) nebo None
+    """
+    return db.session.execute(
+        select(UserDocument.id, UserDocument.processed_content, UserDocument.content_preview,
+               UserDocument.content_type, UserDocument.folder_id)
+        .filter_by(content_hash=content_hash, status='completed')
+        .limit(1)
+    ).first()
+
+# Mapa typ složky -> ID první složky daného typu. Složky se mění jen zřídka, proto se mapa načte
+# jediným dotazem při startu a obnoví se po každé změně složek (refresh_folder_type_ids).
+# Mapa je per-proces - změny složek v jiném workeru (gunicorn) odhalí ověření v get_folder_id_for_type.
+folder_type_ids = None
+
+def refresh_folder_type_ids():
+    """Načte mapu typ složky -> ID jediným dotazem; pro každý typ se použije složka s nejnižším ID."""
+    global folder_type_ids
+    rows = db.session.execute(select(Folder.folder_type, Folder.id).order_by(Folder.id.desc())).all()
+    folder_type_ids = {folder_type: folder_id for folder_type, folder_id in rows}
+    return folder_type_ids
+
+def get_folder_id_for_type(folder_type):
+    """
+    Vrátí ID první složky daného typu (nebo None) z mapy folder_type_ids.
+
+    ID z mapy se před použitím ověří dotazem podle primárního klíče - složku mohl mezitím smazat
+    nebo znovu vytvořit jiný proces, jehož změnu mapa tohoto procesu nezachytila, a dokument by
+    jinak dostal folder_id neexistující složky (SQLite cizí klíč nevynucuje). Při nesouladu
+    se mapa načte znovu. Běží ve vlastním app contextu, takže ji lze volat i z workerů.
+    """
+    with app.app_context():
+        type_ids = folder_type_ids
+        if type_ids is None:
+            type_ids = refresh_folder_type_ids()
+        folder_id = type_ids.get(folder_type)
+        if folder_id is not None and \
+           db.session.scalar(select(Folder.folder_type).where(Folder.id == folder_id)) == folder_type:
+            return folder_id
+        return refresh_folder_type_ids().get(folder_type)
+
+def get_folder_counts(folder_ids):
+    """
+    Načte počty dokumentů a podsložek pro více složek najednou.
+
+    Místo dvou COUNT dotazů na každou složku se provedou pouze dva agregační dotazy s GROUP BY.
+
+    Args:
+        folder_ids: Seznam ID složek
+
+    Returns:
+        dict: {folder_id: {'document_count': int, 'subfolder_count': int}}
+    """
+    counts = {folder_id: {'document_count': 0, 'subfolder_count': 0} for folder_id in folder_ids}
+    if not counts:
+        return counts
+
+    document_counts = db.session.query(UserDocument.folder_id, func.count(UserDocument.id)) \
+        .filter(UserDocument.folder_id.in_(counts.keys())) \
+        .group_by(UserDocument.folder_id).all()
+    for folder_id, count in document_counts:
+        counts[folder_id]['document_count'] = count
+
+    subfolder_counts = db.session.query(Folder.parent_id, func.count(Folder.id)) \
+        .filter(Folder.parent_id.in_(counts.keys())) \
+        .group_by(Folder.parent_id).all()
+    for folder_id, count in subfolder_counts:
+        counts[folder_id]['subfolder_count'] = count
+
+    return counts
+
+def detect_content_type(processed_content, doc_id=None):
+    """
+    Detekuje typ obsahu dokumentu na základě jeho zpracovaného obsahu a určí odpovídající složku.
+
+    Funkce instanci dokumentu nemění - volající nastaví typ, složku i stav najednou,
+    takže se řádek zapíše jediným UPDATE.
+
+    Args:
+        processed_content: Zpracovaný obsah dokumentu
+        doc_id: ID dokumentu (pouze pro logování)
+
+    Returns:
+        tuple: (content_type, folder_id) - folder_id je None, pokud se dokument do složky nepřiřazuje
+    """
+    if not processed_content:
+        return 'unknown', None
+
+    # Obsah nepřevádíme na malá písmena (kopie celého textu) - regulární výrazy jsou case-insensitive.
+    # Prohledáváme jen omezený začátek dokumentu.
+    content = processed_content[:CONTENT_TYPE_SCAN_CHARS]
+
+    # Detekce emailové korespondence - JSON značky emailového parseru hledáme jen v hlavičce
+    if EMAIL_JSON_SIGNATURE_RE.match(content, 0, EMAIL_JSON_SIGNATURE_CHARS) or \
+       EMAIL_KEYWORDS_RE.search(content):
+        content_type = 'email'
+        folder_type = 'email'
+        app_logger.info(f"Detected email correspondence in document ID {doc_id}")
 
     # Detekce firemního know-how
-    elif any(keyword in content for keyword in ['postup', 'návod', 'how to', 'guide', 'tutorial', 'dokumentace',
-                                               'documentation', 'firemní', 'společnost', 'proces', 'procedura',
-                                               'personální', 'zaměstnanec', 'pracovník', 'mzda', 'plat', 'dovolená',
-                                               'školení', 'nábor', 'pohovor', 'hr', 'human resources']):
-        document.content_type = 'company_know_how'
-        app_logger.info(f"Detected company know-how content in document ID {document.id}")
-
-        # Automatické přiřazení do složky pro firemní know-how
-        try:
-            company_folder = Folder.query.filter_by(folder_type='company_know_how').first()
-            if company_folder:
-                document.folder_id = company_folder.id
-                app_logger.info(f"Automatically assigned document ID {document.id} to company know-how folder ID {company_folder.id}")
-        except Exception as e:
-            app_logger.error(f"Error assigning document to company know-how folder: {e}")
+    elif COMPANY_KNOW_HOW_KEYWORDS_RE.search(content):
+        content_type = 'company_know_how'
+        folder_type = 'company_know_how'
+        app_logger.info(f"Detected company know-how content in document ID {doc_id}")
 
     # Detekce tabulkových dat a obecný obsah - přiřadíme do firemního know-how
     else:
         if '|' in content and '---' in content:
-            document.content_type = 'table'
-            app_logger.info(f"Detected tabular data in document ID {document.id}")
+            content_type = 'table'
+            app_logger.info(f"Detected tabular data in document ID {doc_id}")
         else:
-            document.content_type = 'general'
-            app_logger.info(f"Assigned general content type to document ID {document.id}")
+            content_type = 'general'
+            app_logger.info(f"Assigned general content type to document ID {doc_id}")
+        folder_type = 'company_know_how'
 
-        # Přiřazení do firemního know-how (všechny ostatní dokumenty)
-        try:
-            company_folder = Folder.query.filter_by(folder_type='company_know_how').first()
-            if company_folder:
-                document.folder_id = company_folder.id
-                app_logger.info(f"Automatically assigned document ID {document.id} to company know-how folder ID {company_folder.id}")
-        except Exception as e:
-            app_logger.error(f"Error assigning document to company know-how folder: {e}")
+    # Automatické přiřazení do složky podle typu (ID složky je v cache)
+    folder_id = None
+    try:
+        folder_id = get_folder_id_for_type(folder_type)
+        if folder_id:
+            app_logger.info(f"Automatically assigned document ID {doc_id} to {folder_type} folder ID {folder_id}")
+    except Exception as e:
+        app_logger.error(f"Error assigning document to {folder_type} folder: {e}")
+
+    return content_type, folder_id
 
-# --- Context Processors ---
-@app.context_processor
-def inject_now():
-    """Inject current datetime into template context."""
-    return {'now': datetime.now(timezone.utc)}
+# --- Template Globals ---
+def utc_now():
+    """Return the current UTC datetime for templates."""
+    return datetime.now(timezone.utc)
+
+# Jinja global místo context processoru - čas se počítá jen tam, kde ho šablona opravdu volá,
+# ne při každém renderování
+app.jinja_env.globals['now'] = utc_now
 
 # --- Routes ---
 
@@ -253,84 +659,149 @@ def send_static(path):
 # --- API Endpoints (Placeholders) ---
 
 # Function to process a file in a separate thread
+# --- Status Writer ---
+# Změny stavu dokumentů z workerů nejdou přímo do DB - každý worker by commitoval zvlášť a workery
+# by o zápisový zámek SQLite soupeřily. Změny se řadí do fronty a jediné vlákno je zapisuje
+# dávkově (až STATUS_BATCH_SIZE změn nebo změny za STATUS_BATCH_WAIT_SECONDS v jedné transakci).
+STATUS_BATCH_SIZE = 64
+STATUS_BATCH_WAIT_SECONDS = 0.05
+status_queue = queue.Queue()
+status_writer_thread = None
+status_writer_lock = threading.Lock()
+STATUS_WRITER_STOP = None  # Značka ve frontě: writer zapíše zbývající změny a skončí
+
+def write_status_batch(items):
+    """
+    Zapíše dávku změn stavu dokumentů (bez commitu).
+
+    Změny stejného dokumentu se sloučí (pozdější hodnoty přepíší dřívější), takže má každý dokument
+    v dávce jediný řádek. Dokumenty se stejnou sadou sloupců se pak zapíší jedním executemany UPDATE.
+    Používáme Core UPDATE - ORM bulk update podle primárního klíče by při chybějícím (mezitím
+    smazaném) dokumentu vyhodil StaleDataError a s ním by se ztratila celá dávka.
+
+    Args:
+        items: Seznam dvojic (doc_id, values)
+    """
+    merged = {}
+    for doc_id, values in items:
+        merged.setdefault(doc_id, {}).update(values)
+
+    groups = {}
+    for doc_id, values in merged.items():
+        groups.setdefault(frozenset(values), []).append({'doc_id': doc_id, **values})
+
+    table = UserDocument.__table__
+    statement = update(table).where(table.c.id == bindparam('doc_id'))
+    for rows in groups.values():
+        db.session.execute(statement, rows)
+
+def status_writer():
+    """Vybírá změny stavu z fronty a zapisuje je dávkově jediným commitem; po STATUS_WRITER_STOP dopíše frontu a skončí."""
+    stopping = False
+    while not stopping:
+        items = [status_queue.get()]
+        # Krátce počkáme na další změny, aby se souběžně dokončené úlohy zapsaly jedním commitem
+        deadline = time.monotonic() + STATUS_BATCH_WAIT_SECONDS
+        while len(items) < STATUS_BATCH_SIZE:
+            try:
+                items.append(status_queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+
+        stopping = STATUS_WRITER_STOP in items
+        if stopping:
+            # Při ukončení aplikace zapíšeme v poslední dávce vše, co ve frontě ještě zbylo
+            while True:
+                try:
+                    items.append(status_queue.get_nowait())
+                except queue.Empty:
+                    break
+        updates = [item for item in items if item is not STATUS_WRITER_STOP]
+
+        with app.app_context():
+            try:
+                if updates:
+                    write_status_batch(updates)
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app_logger.error(f"Error writing {len(updates)} status updates: {e}")
+            finally:
+                for _ in items:
+                    status_queue.task_done()
+
+def stop_status_writer():
+    """
+    Při ukončení procesu počká na rozběhnuté úlohy zpracování a zapíše jejich poslední změny stavu.
+
+    Writer je daemon vlákno - bez tohoto handleru by ho interpret ukončil dřív, než zapíše
+    konečné stavy (completed/error), a dokumenty by zůstaly ve stavu 'processing'.
+    """
+    executor.shutdown(wait=True)
+    with status_writer_lock:
+        writer = status_writer_thread
+    if writer is not None and writer.is_alive():
+        status_queue.put(STATUS_WRITER_STOP)
+        writer.join()
+
+atexit.register(stop_status_writer)
+
+def queue_status_update(doc_id, **values):
+    """Zařadí změnu sloupců dokumentu do fronty pro writer vlákno (vlákno se spustí při prvním použití)."""
+    global status_writer_thread
+    if status_writer_thread is None:
+        with status_writer_lock:
+            if status_writer_thread is None:
+                status_writer_thread = threading.Thread(target=status_writer, name='status-writer', daemon=True)
+                status_writer_thread.start()
+    status_queue.put((doc_id, values))
+
 def process_file_async(file_path, doc_id):
-    """Process a file asynchronously and update the database with the result."""
+    """Process a file asynchronously and queue the result for the status writer."""
     try:
         app_logger.info(f"Starting async processing for document ID: {doc_id}")
 
-        # Get the document from the database
-        with app.app_context():
-            doc = db.session.get(UserDocument, doc_id)
-            if not doc:
-                app_logger.error(f"Document ID {doc_id} not found for async processing")
-                return
-
-            # Update status to processing
-            doc.status = 'processing'
-            db.session.commit()
+        # Update status to processing
+        queue_status_update(doc_id, status='processing')
 
-        # Process the file
-        processing_result = process_file(file_path)
+        # Process the file in a separate process
+        processing_result = run_in_process_pool(process_file, file_path)
         app_logger.info(f"Async processing finished for document ID: {doc_id}. Result error: {processing_result.get('error')}")
 
-        # Update the database with the result
-        with app.app_context():
-            doc_to_update = db.session.get(UserDocument, doc_id)
-            if not doc_to_update:
-                app_logger.error(f"Document ID {doc_id} not found after async processing")
-                return
-
-            if processing_result.get("error") and processing_result.get("content") is None:
-                # Standard error case - no content
-                doc_to_update.status = 'error'
-                doc_to_update.error_message = processing_result["error"]
-                app_logger.error(f"Processing error for doc ID {doc_id}: {processing_result['error']}")
-            elif processing_result.get("error") and processing_result.get("content") is not None:
-                # Special case: we have both error and content
-                doc_to_update.status = 'warning'
-                doc_to_update.error_message = processing_result["error"]
-                doc_to_update.processed_content = processing_result["content"]
-                app_logger.warning(f"Processing warning for doc ID {doc_id}: {processing_result['error']}")
-
-                # Detekce typu obsahu - make sure this runs in app context
-                detect_content_type(doc_to_update)
-            else:
-                # Success case
-                doc_to_update.status = 'completed'
-                doc_to_update.processed_content = processing_result.get("content", "[No content returned]")
+        if processing_result.get("error") and processing_result.get("content") is None:
+            # Standard error case - no content
+            values = {'status': 'error', 'error_message': processing_result["error"]}
+            app_logger.error(f"Processing error for doc ID {doc_id}: {processing_result['error']}")
+        elif processing_result.get("error") and processing_result.get("content") is not None:
+            # Special case: we have both error and content
+            values = {
+                'status': 'warning',
+                'error_message': processing_result["error"],
+                'processed_content': processing_result["content"]
+            }
+            app_logger.warning(f"Processing warning for doc ID {doc_id}: {processing_result['error']}")
+        else:
+            # Success case
+            values = {
+                'status': 'completed',
+                'processed_content': processing_result.get("content", "[No content returned]")
+            }
 
-                # Detekce typu obsahu - make sure this runs in app context
-                detect_content_type(doc_to_update)
+        if values['status'] != 'error':
+            # Detekce typu obsahu - typ a složka jdou do stejného UPDATE jako stav (bez přístupu do DB)
+            content_type, folder_id = detect_content_type(values['processed_content'], doc_id)
+            values['content_preview'] = make_content_preview(values['processed_content'])
+            values['content_type'] = content_type
+            if folder_id:
+                values['folder_id'] = folder_id
 
-            db.session.commit()
-            app_logger.info(f"Updated DB record for doc ID {doc_id} with status: {doc_to_update.status}")
+        queue_status_update(doc_id, **values)
+        app_logger.info(f"Queued DB update for doc ID {doc_id} with status: {values['status']}")
 
     except Exception as e:
         app_logger.exception(f"Unhandled exception during async processing for doc ID {doc_id}: {e}")
         # Update the database with the error
-        with app.app_context():
-            try:
-                doc = db.session.get(UserDocument, doc_id)
-                if doc and doc.status != 'completed':
-                    doc.status = 'error'
-                    doc.error_message = f"Server error during async processing: {e}"
-                    db.session.commit()
-            except Exception as db_error:
-                app_logger.error(f"Error updating database after async processing error: {db_error}")
-    finally:
-        # Clean up any temporary resources if needed
-        try:
-            # We need to use app context for database operations
-            with app.app_context():
-                # Check if the file is a temporary part file that should be cleaned up
-                if doc_id:
-                    doc = db.session.get(UserDocument, doc_id)
-                    if doc and doc.parent_id:
-                        # This is a part file, we might want to clean it up after processing
-                        # For now, we'll keep it for debugging purposes
-                        pass
-        except Exception as cleanup_error:
-            app_logger.error(f"Error during cleanup for doc ID {doc_id}: {cleanup_error}")
+        queue_status_update(doc_id, status='error', error_message=f"Server error during async processing: {e}")
 
 # Function to submit a file processing task to the thread pool
 def submit_processing_task(file_path, doc_id):
@@ -338,6 +809,146 @@ def submit_processing_task(file_path, doc_id):
     app_logger.info(f"Submitting processing task for document ID: {doc_id}")
     return executor.submit(process_file_async, file_path, doc_id)
 
+def split_uploaded_document(doc, save_path, reason):
+    """
+    Rozdělí nahraný soubor na části a vytvoří pro ně DB záznamy jediným commitem.
+
+    Args:
+        doc: Rodičovský dokument (UserDocument) v aktuální session
+        save_path: Cesta k uloženému souboru
+        reason: Důvod rozdělení (pro log)
+
+    Returns:
+        list: Dvojice (cesta k části, ID části) ke zpracování; prázdný seznam, pokud rozdělení selhalo
+    """
+    app_logger.info(f"Soubor {doc.original_filename} bude rozdělen: {reason}")
+
+    try:
+        # Split the file
+        split_folder, part_files, num_chunks = split_file(save_path, app.config['UPLOAD_FOLDER'])
+
+        if not (split_folder and part_files and num_chunks > 0):
+            # Splitting failed, process the original file
+            app_logger.warning(f"Rozdělení souboru {doc.original_filename} selhalo, zpracování původního souboru")
+            return []
+
+        # Update the parent document
+        doc.is_split = True
+        doc.split_folder = split_folder
+        doc.total_parts = num_chunks
+        doc.status = 'split'
+
+        # Create document records for each part - záznamy se vloží hromadně
+        # (parent_id se doplní při flush přes vztah)
+        part_docs = [
+            UserDocument(
+                original_filename=f"{doc.original_filename} (Část {i+1}/{num_chunks})",
+                stored_filename=os.path.basename(part_file),
+                status='pending',
+                parent=doc,
+                part_number=i+1,
+                total_parts=num_chunks
+            )
+            for i, part_file in enumerate(part_files)
+        ]
+
+        # Jediný commit pro rodiče i všechny části; ID přiřadí flush
+        db.session.add_all(part_docs)
+        db.session.flush()
+        part_tasks = [(part_file, part_doc.id) for part_file, part_doc in zip(part_files, part_docs)]
+        db.session.commit()
+        app_logger.info(f"Created {num_chunks} part records for document ID {doc.id}")
+        return part_tasks
+    except Exception as split_error:
+        db.session.rollback()
+        app_logger.error(f"Chyba při rozdělování souboru {doc.original_filename}: {split_error}")
+        # Process the original file instead
+        return []
+
+def ingest_uploaded_file(save_path, doc_id):
+    """
+    Rozhodne o rozdělení nahraného souboru a spustí jeho zpracování.
+
+    Běží v thread poolu, takže dělení velkých souborů (čtení i zápis všech částí)
+    neblokuje vlákno obsluhující HTTP požadavek.
+    """
+    part_tasks = []
+    try:
+        with app.app_context():
+            doc = db.session.get(UserDocument, doc_id)
+            if doc is None:
+                app_logger.warning(f"Document ID {doc_id} was deleted before processing started")
+                return
+
+            # Check if the file should be split
+            should_split, reason = should_split_file(save_path)
+            if should_split:
+                part_tasks = split_uploaded_document(doc, save_path, reason)
+    except Exception as e:
+        app_logger.exception(f"Unhandled exception while preparing document ID {doc_id}: {e}")
+
+    if part_tasks:
+        # Části zpracují ostatní workery paralelně
+        for part_path, part_doc_id in part_tasks:
+            submit_processing_task(part_path, part_doc_id)
+    else:
+        # Soubor se nerozdělil - zpracujeme původní soubor přímo v tomto workeru
+        process_file_async(save_path, doc_id)
+
+def submit_ingest_task(save_path, doc_id):
+    """Submit a newly uploaded file to the thread pool (splitting and processing)."""
+    app_logger.info(f"Submitting ingest task for document ID: {doc_id}")
+    return executor.submit(ingest_uploaded_file, save_path, doc_id)
+
+def register_uploaded_file(original_filename, unique_filename, save_path, content_hash):
+    """
+    Vytvoří DB záznam pro uložený soubor, případně převezme výsledek duplicity.
+
+    Rozdělení velkých souborů a jejich zpracování proběhne až ve workeru (ingest_uploaded_file).
+
+    Args:
+        original_filename: Zabezpečený původní název souboru
+        unique_filename: Jedinečný název souboru v UPLOAD_FOLDER
+        save_path: Cesta k uloženému souboru
+        content_hash: SHA-256 hash obsahu souboru
+
+    Returns:
+        tuple: (file_info, task_ids) - informace pro odpověď a seznam (cesta, ID dokumentu) pro submit_ingest_task
+    """
+    new_doc = UserDocument(
+        original_filename=original_filename,
+        stored_filename=unique_filename,
+        status='pending',
+        content_hash=content_hash
+    )
+    file_info = {
+        "original_filename": original_filename,
+        "status": "pending"
+    }
+
+    # Pokud byl stejný soubor již zpracován, převezmeme výsledek a zpracování přeskočíme
+    duplicate = find_processed_duplicate(content_hash)
+    if duplicate:
+        new_doc.status = 'completed'
+        new_doc.processed_content = duplicate.processed_content
+        new_doc.content_preview = duplicate.content_preview
+        new_doc.content_type = duplicate.content_type
+        new_doc.folder_id = duplicate.folder_id
+        file_info["status"] = "completed"
+        file_info["duplicate_of"] = duplicate.id
+        app_logger.info(f"File {original_filename} is identical to document ID {duplicate.id}, reusing its processed content")
+
+    # ID přiřadí flush - po commitu už na objekt nesaháme
+    db.session.add(new_doc)
+    db.session.flush()
+    doc_id = new_doc.id
+    db.session.commit()
+    app_logger.info(f"Created DB record for {original_filename} (ID: {doc_id})")
+
+    file_info["doc_id"] = doc_id
+    task_ids = [] if duplicate else [(save_path, doc_id)]
+    return file_info, task_ids
+
 @app.route('/api/upload', methods=['POST'])
 def upload_files():
     """Handles multiple file uploads, saves the files, and triggers parallel processing."""
@@ -354,151 +965,62 @@ def upload_files():
 
     # Process each file
     uploaded_files = []
-    processing_futures = []
+    # Úlohy (cesta k souboru, ID dokumentu) odešleme do thread poolu až po commitu všech souborů,
+    # aby workery viděly konzistentní stav a jejich commity nesoupeřily s commity nahrávání
+    tasks_to_submit = []
+    # Konfiguraci čteme jednou pro celý požadavek, ne pro každý soubor
+    upload_folder = app.config['UPLOAD_FOLDER']
+    buffer_size = app.config['UPLOAD_BUFFER_SIZE']
 
     for file in files:
         if file and file.filename != '':
+            save_path = None
+            streamed_to_disk = False
             try:
                 original_filename = secure_filename(file.filename)
-                # Generate a unique filename
-                file_extension = os.path.splitext(original_filename)[1]
-                unique_filename = f"{uuid.uuid4()}{file_extension}"
-                save_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-
-                # Create initial DB record
-                new_doc = UserDocument(
-                    original_filename=original_filename,
-                    stored_filename=unique_filename,
-                    status='saving'
-                )
-                db.session.add(new_doc)
-                db.session.commit()
-                doc_id = new_doc.id
-                app_logger.info(f"Created initial DB record for {original_filename} (ID: {doc_id})")
-
-                # Save the file
-                file.save(save_path)
-                app_logger.info(f"File {original_filename} saved as {unique_filename} at {save_path}")
-
-                # Check if the file should be split
-                should_split, reason = should_split_file(save_path)
-
-                if should_split:
-                    app_logger.info(f"Soubor {original_filename} bude rozdělen: {reason}")
-
-                    # Update status to indicate splitting
-                    new_doc.status = 'splitting'
-                    db.session.commit()
-
-                    try:
-                        # Split the file
-                        split_folder, part_files, num_chunks = split_file(save_path, app.config['UPLOAD_FOLDER'])
-
-                        if split_folder and part_files and num_chunks > 0:
-                            # Update the parent document
-                            new_doc.is_split = True
-                            new_doc.split_folder = split_folder
-                            new_doc.total_parts = num_chunks
-                            new_doc.status = 'split'
-                            db.session.commit()
-
-                            # Create document records for each part
-                            part_doc_ids = []
-                            for i, part_file in enumerate(part_files):
-                                part_filename = os.path.basename(part_file)
-                                part_original_filename = f"{original_filename} (Část {i+1}/{num_chunks})"
-
-                                # Create DB record for the part
-                                part_doc = UserDocument(
-                                    original_filename=part_original_filename,
-                                    stored_filename=part_filename,
-                                    status='pending',
-                                    parent_id=doc_id,
-                                    part_number=i+1,
-                                    total_parts=num_chunks
-                                )
-                                db.session.add(part_doc)
-                                db.session.commit()
-                                part_doc_id = part_doc.id
-                                part_doc_ids.append(part_doc_id)
-
-                                # Submit task to thread pool
-                                future = submit_processing_task(part_file, part_doc_id)
-                                processing_futures.append(future)
-
-                                app_logger.info(f"Zpracování části {i+1}/{num_chunks} souboru {original_filename} zahájeno (ID: {part_doc_id})")
-
-                            # Add to the list of uploaded files
-                            uploaded_files.append({
-                                "original_filename": original_filename,
-                                "doc_id": doc_id,
-                                "status": "split",
-                                "parts": num_chunks,
-                                "part_ids": part_doc_ids
-                            })
-                        else:
-                            # Splitting failed, process the original file
-                            app_logger.warning(f"Rozdělení souboru {original_filename} selhalo, zpracování původního souboru")
-                            new_doc.status = 'pending'
-                            db.session.commit()
-
-                            # Submit task to thread pool
-                            future = submit_processing_task(save_path, doc_id)
-                            processing_futures.append(future)
-
-                            # Add to the list of uploaded files
-                            uploaded_files.append({
-                                "original_filename": original_filename,
-                                "doc_id": doc_id,
-                                "status": "pending"
-                            })
-                    except Exception as split_error:
-                        app_logger.error(f"Chyba při rozdělování souboru {original_filename}: {split_error}")
-                        # Process the original file instead
-                        new_doc.status = 'pending'
-                        db.session.commit()
-
-                        # Submit task to thread pool
-                        future = submit_processing_task(save_path, doc_id)
-                        processing_futures.append(future)
-
-                        # Add to the list of uploaded files
-                        uploaded_files.append({
-                            "original_filename": original_filename,
-                            "doc_id": doc_id,
-                            "status": "pending",
-                            "warning": f"Rozdělení souboru selhalo: {str(split_error)}"
-                        })
+                file_extension = get_file_extension(original_filename)
+                if file_extension not in ALLOWED_EXTENSIONS:
+                    app_logger.warning(f"Upload of {original_filename} rejected: unsupported file type '{file_extension}'")
+                    uploaded_files.append({
+                        "original_filename": file.filename,
+                        "error": f"Unsupported file type: {file_extension or 'none'}",
+                        "status": "error"
+                    })
+                    continue
+
+                streamed_to_disk = isinstance(file.stream, HashingUploadFile)
+                if streamed_to_disk:
+                    # Parser formuláře soubor již zapsal přímo do UPLOAD_FOLDER a spočítal jeho hash
+                    file.stream.close()
+                    save_path = file.stream.save_path
+                    unique_filename = os.path.basename(save_path)
+                    content_hash = file.stream.hexdigest()
                 else:
-                    # Update status to pending
-                    new_doc.status = 'pending'
-                    db.session.commit()
+                    # Generate a unique filename
+                    unique_filename = make_unique_filename(file_extension)
+                    save_path = os.path.join(upload_folder, unique_filename)
 
-                    # Submit task to thread pool
-                    future = submit_processing_task(save_path, doc_id)
-                    processing_futures.append(future)
+                    # Save the file - streamujeme s velkým bufferem místo výchozích 16KB ve file.save()
+                    # a zároveň počítáme hash obsahu pro deduplikaci
+                    content_hash = save_file_stream(file.stream, save_path, buffer_size)
+                app_logger.info(f"File {original_filename} saved as {unique_filename} at {save_path}")
 
-                    # Add to the list of uploaded files
-                    uploaded_files.append({
-                        "original_filename": original_filename,
-                        "doc_id": doc_id,
-                        "status": "pending"
-                    })
+                file_info, task_ids = register_uploaded_file(original_filename, unique_filename, save_path, content_hash)
+                tasks_to_submit.extend(task_ids)
+                if streamed_to_disk:
+                    file.stream.claimed = True
+
+                # Add to the list of uploaded files
+                uploaded_files.append(file_info)
 
             except Exception as e:
                 db.session.rollback()
                 app_logger.exception(f"Unhandled exception during file upload for {file.filename}:")
 
-                # Try to clean up DB entry if it exists
-                if 'new_doc' in locals() and hasattr(new_doc, 'id') and new_doc.id:
-                    try:
-                        doc = db.session.get(UserDocument, new_doc.id)
-                        if doc and doc.status != 'completed':
-                            doc.status = 'error'
-                            doc.error_message = f"Server error during upload: {e}"
-                            db.session.commit()
-                    except Exception as db_error:
-                        app_logger.error(f"Error updating database after upload error: {db_error}")
+                # Záznam souboru se ukládá jediným commitem - po rollbacku v DB nic nezůstane.
+                # Soubor zapsaný přímo parserem smaže UploadRequest.close(), ostatní smažeme zde
+                if save_path is not None and not streamed_to_disk:
+                    remove_paths(file_paths=[save_path])
 
                 # Add error to the list
                 uploaded_files.append({
@@ -507,12 +1029,77 @@ def upload_files():
                     "status": "error"
                 })
 
+    # Submit tasks to thread pool - všechny záznamy jsou již potvrzené; výsledky zapisuje
+    # status writer, takže na futures nečekáme a neuchováváme je
+    for task_path, task_doc_id in tasks_to_submit:
+        submit_ingest_task(task_path, task_doc_id)
+
     # Return information about all uploaded files
     return jsonify({
         "message": f"{len(uploaded_files)} files uploaded and processing started.",
         "files": uploaded_files
     }), 202  # 202 Accepted - processing has started but not completed
 
+@app.route('/api/upload_raw', methods=['POST'])
+def upload_raw_file():
+    """
+    Nahraje jeden soubor poslaný přímo jako tělo požadavku (bez multipart/form-data).
+
+    Tělo se streamuje na disk po blocích, takže velké soubory neprocházejí parserem
+    multipart formuláře. Název souboru se předává v hlavičce X-Filename (URL-encoded).
+    """
+    raw_filename = request.headers.get('X-Filename', '')
+    original_filename = secure_filename(unquote(raw_filename))
+    if not original_filename:
+        app_logger.warning("Raw upload attempt without X-Filename header.")
+        return jsonify({"error": "Missing X-Filename header"}), 400
+
+    file_extension = get_file_extension(original_filename)
+    if file_extension not in ALLOWED_EXTENSIONS:
+        app_logger.warning(f"Raw upload of {original_filename} rejected: unsupported file type '{file_extension}'")
+        return jsonify({"error": f"Unsupported file type: {file_extension or 'none'}"}), 400
+
+    unique_filename = make_unique_filename(file_extension)
+    save_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+
+    try:
+        # Tělo požadavku čteme přímo z request.stream po blocích velikosti UPLOAD_BUFFER_SIZE
+        content_hash = save_file_stream(request.stream, save_path, app.config['UPLOAD_BUFFER_SIZE'])
+        if os.path.getsize(save_path) == 0:
+            os.remove(save_path)
+            app_logger.warning(f"Raw upload of {original_filename} has empty body.")
+            return jsonify({"error": "Empty request body"}), 400
+        app_logger.info(f"File {original_filename} saved as {unique_filename} at {save_path} (raw upload)")
+
+        file_info, task_ids = register_uploaded_file(original_filename, unique_filename, save_path, content_hash)
+    except HTTPException as e:
+        # Chyba klienta při čtení těla - např. RequestEntityTooLarge (tělo nad MAX_CONTENT_LENGTH) vrací 413, ne 500
+        app_logger.warning(f"Raw upload of {original_filename} rejected: {e}")
+        remove_paths(file_paths=[save_path])
+        return jsonify({
+            "original_filename": raw_filename,
+            "error": e.description,
+            "status": "error"
+        }), e.code
+    except Exception as e:
+        db.session.rollback()
+        app_logger.exception(f"Unhandled exception during raw file upload for {raw_filename}:")
+        # Bez DB záznamu by uložený (i částečně) soubor zůstal na disku osiřelý
+        remove_paths(file_paths=[save_path])
+        return jsonify({
+            "original_filename": raw_filename,
+            "error": str(e),
+            "status": "error"
+        }), 500
+
+    for task_path, task_doc_id in task_ids:
+        submit_ingest_task(task_path, task_doc_id)
+
+    return jsonify({
+        "message": "File uploaded and processing started.",
+        "files": [file_info]
+    }), 202
+
 @app.route('/api/documents', methods=['GET'])
 def list_documents():
     """Lists processed documents for the user."""
@@ -557,20 +1144,28 @@ def list_documents():
         # Seřazení podle času nahrání
         query = query.order_by(UserDocument.upload_time.desc())
 
+        # Optimalizace: Načteme jen sloupce potřebné pro výpis - bez velkých TEXT sloupců
+        # (processed_content, error_message); přístup k ostatním sloupcům vyvolá výjimku
+        query = query.options(load_only(
+            UserDocument.id, UserDocument.original_filename, UserDocument.status, UserDocument.upload_time,
+            UserDocument.content_type, UserDocument.folder_id, UserDocument.is_split, UserDocument.total_parts,
+            UserDocument.parent_id, UserDocument.part_number,
+            raiseload=True
+        ))
+
+        # Optimalizace: Části rozdělených dokumentů načteme jedním IN dotazem (selectinload),
+        # ostatní vztahy jsou zakázané (raiseload), aby se nevrátil N+1 problém
+        if show_parts:
+            query = query.options(
+                selectinload(UserDocument.parts).load_only(UserDocument.id, UserDocument.part_number, UserDocument.status),
+                raiseload('*')
+            )
+        else:
+            query = query.options(raiseload('*'))
+
         # Stránkování pro optimalizaci výkonu
         paginated_docs = query.paginate(page=page, per_page=per_page, error_out=False)
 
-        # Optimalizace: Předem načteme všechny části dokumentů v jednom dotazu, pokud jsou požadovány
-        parts_by_parent = {}
-        if show_parts:
-            parent_ids = [doc.id for doc in paginated_docs.items if doc.is_split]
-            if parent_ids:
-                parts = UserDocument.query.filter(UserDocument.parent_id.in_(parent_ids)).order_by(UserDocument.part_number).all()
-                for part in parts:
-                    if part.parent_id not in parts_by_parent:
-                        parts_by_parent[part.parent_id] = []
-                    parts_by_parent[part.parent_id].append(part)
-
         # Vytvoření seznamu dokumentů
         doc_list = []
         for doc in paginated_docs.items:
@@ -578,7 +1173,7 @@ def list_documents():
                 "id": doc.id,
                 "original_filename": doc.original_filename,
                 "status": doc.status,
-                "upload_time": doc.upload_time.isoformat(),
+                "upload_time": doc.upload_time,
                 "content_type": doc.content_type,
                 "folder_id": doc.folder_id
             }
@@ -589,12 +1184,12 @@ def list_documents():
                 doc_info["total_parts"] = doc.total_parts
 
                 # Přidání informací o částech, pokud jsou požadovány
-                if show_parts and doc.id in parts_by_parent:
+                if show_parts and doc.parts:
                     doc_info["parts"] = [{
                         "id": part.id,
                         "part_number": part.part_number,
                         "status": part.status
-                    } for part in parts_by_parent[doc.id]]
+                    } for part in doc.parts]
             elif doc.parent_id:
                 # Toto je část rozděleného dokumentu
                 doc_info["is_part"] = True
@@ -630,7 +1225,13 @@ def get_document_details(doc_id):
     # 2. Query DB for the specific document
     # 3. Return full document details including processed_content if 'completed'
     # Placeholder implementation:
-    doc = db.get_or_404(UserDocument, doc_id)
+    # processed_content je odložený sloupec - načte se až při přístupu, tedy jen pro 'completed'/'warning'.
+    # Název rodiče (u částí) načteme ve stejném dotazu přes LEFT OUTER JOIN.
+    doc = db.one_or_404(
+        select(UserDocument)
+        .options(joinedload(UserDocument.parent).load_only(UserDocument.id, UserDocument.original_filename))
+        .where(UserDocument.id == doc_id)
+    )
     # TODO: Add ownership check
 
     # Základní informace o dokumentu
@@ -638,7 +1239,7 @@ def get_document_details(doc_id):
         "id": doc.id,
         "original_filename": doc.original_filename,
         "status": doc.status,
-        "upload_time": doc.upload_time.isoformat(),
+        "upload_time": doc.upload_time,
         "processed_content": doc.processed_content if doc.status in ['completed', 'warning'] else None,
         "error_message": doc.error_message if doc.status in ['error', 'warning'] else None
     }
@@ -646,7 +1247,9 @@ def get_document_details(doc_id):
     # Přidání informací o rozdělených souborech
     if doc.is_split:
         # Dokument byl rozdělen na části
-        parts = UserDocument.query.filter_by(parent_id=doc.id).order_by(UserDocument.part_number).all()
+        parts = UserDocument.query.options(
+            load_only(UserDocument.id, UserDocument.part_number, UserDocument.status, UserDocument.original_filename)
+        ).filter_by(parent_id=doc.id).order_by(UserDocument.part_number).all()
         result["is_split"] = True
         result["total_parts"] = doc.total_parts
         result["parts"] = [{
@@ -657,12 +1260,12 @@ def get_document_details(doc_id):
         } for part in parts]
     elif doc.parent_id:
         # Toto je část rozděleného dokumentu
-        parent = UserDocument.query.get(doc.parent_id)
+        parent_filename = doc.parent.original_filename if doc.parent else None
         result["is_part"] = True
         result["part_number"] = doc.part_number
         result["total_parts"] = doc.total_parts
         result["parent_id"] = doc.parent_id
-        result["parent_filename"] = parent.original_filename if parent else "Unknown"
+        result["parent_filename"] = parent_filename or "Unknown"
 
     return jsonify(result)
 
@@ -689,10 +1292,12 @@ def update_document(doc_id):
         # Update document content if provided
         if 'processed_content' in data and doc.status in ['completed', 'warning']:
             doc.processed_content = data['processed_content']
+            doc.content_preview = make_content_preview(doc.processed_content)
             app_logger.info(f"Updated content for document {doc_id}")
 
-        # Save changes
-        db.session.commit()
+        # Save changes - odpověď se sestaví z hodnot v paměti bez opětovného načtení
+        with no_expire_on_commit(db.session):
+            db.session.commit()
 
         return jsonify({
             "id": doc.id,
@@ -735,11 +1340,12 @@ def list_folders():
         # Seřazení podle názvu
         query = query.order_by(Folder.name)
 
-        # Získání složek
-        folders = query.all()
+        # Získání složek - to_dict potřebuje všechny (krátké) sloupce složky, vztahy se ale načítat nesmí
+        folders = db.session.execute(query.options(raiseload('*')).statement).scalars().all()
 
-        # Převod na seznam slovníků
-        folder_list = [folder.to_dict() for folder in folders]
+        # Převod na seznam slovníků - počty načteme pro všechny složky najednou
+        counts = get_folder_counts([folder.id for folder in folders])
+        folder_list = [folder.to_dict(counts=counts) for folder in folders]
 
         return jsonify(folder_list)
     except Exception as e:
@@ -767,12 +1373,17 @@ def create_folder():
         )
 
         # Uložení do databáze
+        folder_type = new_folder.folder_type
         db.session.add(new_folder)
         db.session.commit()
+        # Mapu typů stačí obnovit jen pro dosud nezastoupený typ (jinak zůstává starší složka)
+        if folder_type_ids is None or folder_type not in folder_type_ids:
+            refresh_folder_type_ids()
 
         app_logger.info(f"Created new folder: {new_folder.name} (ID: {new_folder.id})")
 
-        return jsonify(new_folder.to_dict()), 201
+        # Nová složka zatím nemá dokumenty ani podsložky - počty není třeba dotazovat
+        return jsonify(new_folder.to_dict(counts={})), 201
     except Exception as e:
         db.session.rollback()
         app_logger.error(f"Error creating folder: {e}")
@@ -782,18 +1393,32 @@ def create_folder():
 def get_folder_details(folder_id):
     """Vrátí detaily konkrétní složky včetně dokumentů a podsložek."""
     try:
-        folder = db.get_or_404(Folder, folder_id)
+        # Složku načteme spolu s dokumenty a podsložkami (selectin dávky); raiseload zabrání
+        # skrytému lazy načítání dalších vztahů při serializaci
+        folder = db.first_or_404(
+            select(Folder).where(Folder.id == folder_id).options(
+                # U dokumentů načteme jen sloupce, které používá UserDocument.to_dict()
+                selectinload(Folder.documents).load_only(
+                    UserDocument.id, UserDocument.original_filename, UserDocument.status, UserDocument.upload_time,
+                    UserDocument.content_type, UserDocument.folder_id, UserDocument.tags, UserDocument.content_preview,
+                    UserDocument.error_message, UserDocument.is_split, UserDocument.total_parts,
+                    UserDocument.parent_id, UserDocument.part_number,
+                    raiseload=True
+                ),
+                selectinload(Folder.subfolders),
+                raiseload('*')
+            )
+        )
+        documents = folder.documents
+        subfolders = folder.subfolders
 
-        # Základní informace o složce
-        result = folder.to_dict()
+        # Počty pro složku i všechny podsložky načteme najednou
+        counts = get_folder_counts([folder_id] + [subfolder.id for subfolder in subfolders])
 
-        # Přidání seznamu dokumentů ve složce
-        documents = UserDocument.query.filter_by(folder_id=folder_id).all()
+        # Základní informace o složce
+        result = folder.to_dict(counts=counts)
         result['documents'] = [doc.to_dict() for doc in documents]
-
-        # Přidání seznamu podsložek
-        subfolders = Folder.query.filter_by(parent_id=folder_id).all()
-        result['subfolders'] = [subfolder.to_dict() for subfolder in subfolders]
+        result['subfolders'] = [subfolder.to_dict(counts=counts) for subfolder in subfolders]
 
         return jsonify(result)
     except Exception as e:
@@ -819,11 +1444,12 @@ def update_folder(folder_id):
         if 'folder_type' in data:
             folder.folder_type = data['folder_type']
 
-        # Aktualizace času poslední změny
-        folder.updated_at = datetime.now(timezone.utc)
+        # Čas poslední změny nastaví onupdate sloupce updated_at
 
         # Uložení změn
         db.session.commit()
+        if 'folder_type' in data:
+            refresh_folder_type_ids()
 
         app_logger.info(f"Updated folder ID {folder_id}: {folder.name}")
 
@@ -839,23 +1465,25 @@ def delete_folder(folder_id):
     try:
         folder = db.get_or_404(Folder, folder_id)
 
-        # Získání dokumentů ve složce
-        documents = UserDocument.query.filter_by(folder_id=folder_id).all()
-
         # Přesun dokumentů do nadřazené složky nebo nastavení folder_id na None
-        for doc in documents:
-            doc.folder_id = folder.parent_id  # Může být None, pokud složka nemá nadřazenou složku
-
-        # Získání podsložek
-        subfolders = Folder.query.filter_by(parent_id=folder_id).all()
+        # (parent_id může být None, pokud složka nemá nadřazenou složku) - jediný UPDATE pro všechny dokumenty
+        db.session.execute(
+            update(UserDocument).where(UserDocument.folder_id == folder_id).values(folder_id=folder.parent_id),
+            execution_options={'synchronize_session': False}
+        )
 
         # Přesun podsložek do nadřazené složky nebo nastavení parent_id na None
-        for subfolder in subfolders:
-            subfolder.parent_id = folder.parent_id
+        db.session.execute(
+            update(Folder).where(Folder.parent_id == folder_id).values(parent_id=folder.parent_id),
+            execution_options={'synchronize_session': False}
+        )
 
         # Smazání složky
         db.session.delete(folder)
         db.session.commit()
+        # Mapu typů obnovíme, jen pokud byla smazaná složka v mapě použita
+        if folder_type_ids is None or folder_id in folder_type_ids.values():
+            refresh_folder_type_ids()
 
         app_logger.info(f"Deleted folder ID {folder_id}: {folder.name}")
 
@@ -877,6 +1505,10 @@ def move_document(doc_id):
         if 'folder_id' not in data:
             return jsonify({"error": "Folder ID is required"}), 400
 
+        # Tagy přijímáme pouze jako seznam řetězců - ukládají se přímo do JSON sloupce
+        if 'tags' in data and not (isinstance(data['tags'], list) and all(isinstance(tag, str) for tag in data['tags'])):
+            return jsonify({"error": "Tags must be a list of strings"}), 400
+
         # Kontrola, zda cílová složka existuje (pokud není None)
         target_folder_id = data['folder_id']
         if target_folder_id is not None:
@@ -894,13 +1526,11 @@ def move_document(doc_id):
 
         # Aktualizace tagů, pokud jsou poskytnuty
         if 'tags' in data:
-            if isinstance(data['tags'], list):
-                doc.tags = ','.join(data['tags'])
-            else:
-                doc.tags = data['tags']
+            doc.tags = data['tags']
 
         # Uložení změn
-        db.session.commit()
+        with no_expire_on_commit(db.session):
+            db.session.commit()
 
         app_logger.info(f"Moved document ID {doc_id} from folder ID {old_folder_id} to folder ID {target_folder_id}")
 
@@ -916,61 +1546,51 @@ def delete_document(doc_id):
     # TODO: Add ownership check
     doc = db.get_or_404(UserDocument, doc_id)
     try:
+        # Soubory mažeme až po commitu v pozadí - požadavek čeká jen na DB
+        file_paths = [os.path.join(app.config['UPLOAD_FOLDER'], doc.stored_filename)]
+        folder_paths = []
+
         # Kontrola, zda je dokument rozdělen na části
         if doc.is_split:
-            # Získání všech částí dokumentu
-            parts = UserDocument.query.filter_by(parent_id=doc.id).all()
-
-            # Smazání všech částí
-            for part in parts:
-                # Smazání souboru části
-                part_path = os.path.join(app.config['UPLOAD_FOLDER'], part.stored_filename)
-                if os.path.exists(part_path):
-                    try:
-                        os.remove(part_path)
-                        app_logger.info(f"Deleted part file: {part_path}")
-                    except OSError as e:
-                        app_logger.error(f"Error deleting part file {part_path}: {e}")
-
-                # Smazání záznamu části
-                db.session.delete(part)
-                app_logger.info(f"Deleted part document record ID: {part.id}")
-
-            # Smazání složky s částmi, pokud existuje
-            if doc.split_folder and os.path.exists(doc.split_folder):
-                try:
-                    import shutil
-                    shutil.rmtree(doc.split_folder)
-                    app_logger.info(f"Deleted split folder: {doc.split_folder}")
-                except OSError as e:
-                    app_logger.error(f"Error deleting split folder {doc.split_folder}: {e}")
+            # Smazání záznamů všech částí jediným DELETE (části se nenačítají do session)
+            deleted_parts = db.session.execute(
+                delete(UserDocument).where(UserDocument.parent_id == doc.id),
+                execution_options={'synchronize_session': False}
+            ).rowcount
+            app_logger.info(f"Deleted {deleted_parts} part document records of document ID: {doc.id}")
+
+            # Soubory částí leží ve složce split_folder - smažeme ji celou najednou
+            # místo samostatného stat + unlink pro každou část
+            if doc.split_folder:
+                folder_paths.append(doc.split_folder)
+
+        # Delete the database record - přímým DELETE; db.session.delete() by před smazáním
+        # načítal kolekci parts (vztah bez kaskády), i když části už neexistují
+        db.session.execute(
+            delete(UserDocument).where(UserDocument.id == doc.id),
+            execution_options={'synchronize_session': False}
+        )
 
         # Kontrola, zda je dokument částí rozděleného dokumentu
-        elif doc.parent_id:
-            # Pokud je to poslední část, aktualizujeme rodičovský dokument
-            parent = db.session.get(UserDocument, doc.parent_id)
-            if parent:
-                remaining_parts = UserDocument.query.filter_by(parent_id=doc.parent_id).count()
-                if remaining_parts <= 1:  # Tato část je poslední
-                    parent.status = 'incomplete'
-                    app_logger.info(f"Updated parent document {parent.id} status to 'incomplete' (all parts deleted)")
-
-        # Attempt to delete the file from the filesystem
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], doc.stored_filename)
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                app_logger.info(f"Deleted file: {file_path}")
-            except OSError as e:
-                # Log the error but proceed with DB deletion
-                app_logger.error(f"Error deleting file {file_path}: {e}")
-        else:
-            app_logger.warning(f"File not found for deletion, proceeding with DB record removal: {file_path}")
+        if doc.parent_id:
+            # Pokud to byla poslední část, označíme rodiče jako neúplný - jediný UPDATE
+            # s podmínkou NOT EXISTS místo samostatného dotazu na zbývající části
+            other_part = aliased(UserDocument)
+            updated = db.session.execute(
+                update(UserDocument)
+                .where(UserDocument.id == doc.parent_id)
+                .where(~select(other_part.id).where(other_part.parent_id == doc.parent_id).exists())
+                .values(status='incomplete'),
+                execution_options={'synchronize_session': False}
+            ).rowcount
+            if updated:
+                app_logger.info(f"Updated parent document {doc.parent_id} status to 'incomplete' (all parts deleted)")
 
-        # Delete the database record
-        db.session.delete(doc)
         db.session.commit()
         app_logger.info(f"Deleted document record ID: {doc_id}")
+
+        # Delete the files from the filesystem in the background
+        file_cleanup_executor.submit(remove_paths, file_paths, folder_paths)
         return jsonify({"message": "Document deleted successfully"}), 200
     except Exception as e:
         db.session.rollback()
@@ -1020,63 +1640,115 @@ def init_default_folders():
         # Seznam povolených typů složek
         allowed_folder_types = ['email', 'company_know_how']
 
-        # Odstranění nepotřebných složek
-        folders_to_remove = Folder.query.filter(~Folder.folder_type.in_(allowed_folder_types)).all()
-        for folder in folders_to_remove:
-            # Přesunout dokumenty do složky Firemní know-how
-            company_folder = Folder.query.filter_by(folder_type='company_know_how').first()
-            if company_folder:
-                # Přesunout dokumenty do složky Firemní know-how
-                docs = UserDocument.query.filter_by(folder_id=folder.id).all()
-                for doc in docs:
-                    doc.folder_id = company_folder.id
-                    app_logger.info(f"Moved document ID {doc.id} from folder '{folder.name}' to 'Firemní know-how'")
-
-            # Odstranit složku
-            app_logger.info(f"Removing unnecessary folder: {folder.name}")
-            db.session.delete(folder)
-
-        # Vytvoření složek, pokud neexistují
-        for folder_data in default_folders:
-            folder = Folder.query.filter_by(folder_type=folder_data['folder_type']).first()
-            if not folder:
-                folder = Folder(
-                    name=folder_data['name'],
-                    description=folder_data['description'],
-                    folder_type=folder_data['folder_type']
-                )
-                db.session.add(folder)
-                app_logger.info(f"Created default folder: {folder_data['name']}")
+        # Odstranění nepotřebných složek - hromadnými UPDATE/DELETE místo úprav po jednotlivých záznamech
+        folders_to_remove = db.session.execute(
+            select(Folder.id, Folder.name).where(~Folder.folder_type.in_(allowed_folder_types))
+        ).all()
+        if folders_to_remove:
+            ids_to_remove = [folder_id for folder_id, _ in folders_to_remove]
+
+            # Přesunout dokumenty do složky Firemní know-how (pokud neexistuje, dokumenty zůstanou bez složky)
+            company_folder_id = db.session.scalar(select(Folder.id).filter_by(folder_type='company_know_how').limit(1))
+            moved = db.session.execute(
+                update(UserDocument).where(UserDocument.folder_id.in_(ids_to_remove)).values(folder_id=company_folder_id),
+                execution_options={'synchronize_session': False}
+            ).rowcount
+            if moved:
+                app_logger.info(f"Moved {moved} documents from removed folders to folder ID {company_folder_id}")
+
+            # Podsložky odstraněných složek přesuneme do kořene
+            db.session.execute(
+                update(Folder).where(Folder.parent_id.in_(ids_to_remove)).values(parent_id=None),
+                execution_options={'synchronize_session': False}
+            )
+
+            # Odstranit složky
+            for _, folder_name in folders_to_remove:
+                app_logger.info(f"Removing unnecessary folder: {folder_name}")
+            db.session.execute(delete(Folder).where(Folder.id.in_(ids_to_remove)), execution_options={'synchronize_session': False})
+
+        # Vytvoření složek, pokud neexistují - existující výchozí typy zjistíme jediným dotazem
+        # (folder_type není unikátní - uživatel může vytvořit další složky stejného typu,
+        # proto nelze použít INSERT ... ON CONFLICT)
+        existing_types = set(db.session.scalars(
+            select(Folder.folder_type).where(Folder.folder_type.in_(allowed_folder_types)).distinct()
+        ))
+        missing_folders = [folder_data for folder_data in default_folders if folder_data['folder_type'] not in existing_types]
+        db.session.add_all([Folder(**folder_data) for folder_data in missing_folders])
+        for folder_data in missing_folders:
+            app_logger.info(f"Created default folder: {folder_data['name']}")
 
         # Uložení změn
         db.session.commit()
+        refresh_folder_type_ids()
 
-# Inicializace databáze
-with app.app_context():
-    db.create_all() # Create database tables if they don't exist
+def checkpoint_sqlite_wal():
+    """
+    Přenese obsah WAL souboru do databáze a soubor zkrátí.
+
+    SQLite dělá automatický checkpoint po 1000 stránkách, ale WAL soubor sám nezmenšuje -
+    po velkých dávkách zápisů (zpracovaný obsah dokumentů) by zůstal zbytečně velký.
+    """
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            return
+        with db.engine.connect() as connection:
+            busy = connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").scalar()
+        if busy:
+            app_logger.warning("WAL checkpoint nebyl dokončen - databáze byla zaneprázdněná")
+        else:
+            app_logger.info("WAL checkpoint dokončen.")
 
 # Funkce pro pravidelné čištění dočasných souborů
+CLEANUP_INTERVAL_SECONDS = 6 * 60 * 60  # Čištění každých 6 hodin
+
 def schedule_cleanup():
-    """Spustí pravidelné čištění dočasných souborů."""
-    import threading
-    import time
+    """
+    Naplánuje pravidelné čištění dočasných souborů.
+
+    Úloha běží v plánovači sched.scheduler; jako čekací funkce slouží Event.wait,
+    takže plánovač lze při ukončení aplikace okamžitě zastavit (atexit).
+    """
+    import sched
+
+    stop_event = threading.Event()
+    scheduler = sched.scheduler(time.monotonic, stop_event.wait)
 
     def cleanup_task():
-        while True:
-            try:
-                app_logger.info("Spouštím pravidelné čištění dočasných souborů...")
-                cleanup_temp_files(app.config['UPLOAD_FOLDER'], max_age_hours=24)
-                app_logger.info("Čištění dočasných souborů dokončeno.")
-            except Exception as e:
-                app_logger.error(f"Chyba při čištění dočasných souborů: {e}")
+        try:
+            app_logger.info("Spouštím pravidelné čištění dočasných souborů...")
+            cleanup_temp_files(app.config['UPLOAD_FOLDER'], max_age_hours=24)
+            app_logger.info("Čištění dočasných souborů dokončeno.")
+        except Exception as e:
+            app_logger.error(f"Chyba při čištění dočasných souborů: {e}")
 
-            # Počkáme 6 hodin před dalším čištěním
-            time.sleep(6 * 60 * 60)
+        try:
+            prune_cache()
+        except Exception as e:
+            app_logger.error(f"Chyba při čištění cache parsovaného textu: {e}")
 
-    # Spustíme čištění v samostatném vlákně
-    cleanup_thread = threading.Thread(target=cleanup_task)
-    cleanup_thread.daemon = True
+        try:
+            checkpoint_sqlite_wal()
+        except Exception as e:
+            app_logger.error(f"Chyba při WAL checkpointu: {e}")
+
+        # Naplánujeme další čištění
+        if not stop_event.is_set():
+            scheduler.enter(CLEANUP_INTERVAL_SECONDS, 1, cleanup_task)
+
+    def stop_cleanup():
+        for event in scheduler.queue:
+            try:
+                scheduler.cancel(event)
+            except ValueError:
+                pass  # Úloha mezitím proběhla
+        stop_event.set()
+
+    # První čištění proběhne při startu aplikace (viz __main__), další až po intervalu
+    scheduler.enter(CLEANUP_INTERVAL_SECONDS, 1, cleanup_task)
+    cleanup_thread = threading.Thread(target=scheduler.run, name='cleanup-scheduler', daemon=True)
     cleanup_thread.start()
+    atexit.register(stop_cleanup)
     app_logger.info("Naplánováno pravidelné čištění dočasných souborů.")
 
 if __name__ == '__main__':
@@ -1086,8 +1758,9 @@ if __name__ == '__main__':
     # Spustíme pravidelné čištění dočasných souborů
     schedule_cleanup()
 
-    # Vyčistíme dočasné soubory při startu aplikace
+    # Vyčistíme dočasné soubory a starou cache parsovaného textu při startu aplikace
     cleanup_temp_files(app.config['UPLOAD_FOLDER'], max_age_hours=24)
+    prune_cache()
 
     # Get port from environment variable or use default
     port = int(os.environ.get('PORT', 5001))
@@ -32,16 +32,32 @@ import logging
 import subprocess # Added for running external commands like antiword
 import json
 import csv
+import codecs
+import io
+import re
+import itertools
+import contextlib
+import mmap
 import tempfile
+import shutil
+import hashlib
+import functools
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from PIL import Image # Import Pillow
 import PyPDF2 # Import PyPDF2 for PDF parsing
 import docx # Import python-docx for DOCX parsing
+from docx.oxml.ns import qn # Qualified WordprocessingML tag names for direct XML access
 import pandas as pd # For Excel and CSV processing
 import openpyxl # For direct Excel processing
-from bs4 import BeautifulSoup # For HTML parsing
-import odf.opendocument # For ODT parsing
-from odf.text import P, Span # For ODT text elements
+from bs4 import BeautifulSoup, SoupStrainer, Tag, NavigableString, CData # For HTML parsing (fallback when lxml cannot parse a document)
+import lxml.etree
+import lxml.html # For fast HTML parsing
+import zipfile # ODT files are ZIP archives; content.xml is parsed directly with lxml
 import requests # For fetching HTML from URLs
 from .email_parser import is_email_correspondence, process_email_correspondence # Import email parser
 
@@ -54,6 +70,79 @@ except ImportError:
     OCR_AVAILABLE = False
     logging.warning("OCR libraries (pytesseract/pdf2image) not available. OCR functionality will be disabled.")
 
+# Optional PDFium backend (native text extraction and page rendering)
+try:
+    import pypdfium2
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+
+# Optional pdfminer.six backend (used when PDFium is not installed)
+try:
+    from pdfminer.converter import PDFPageAggregator
+    from pdfminer.layout import LAParams, LTTextContainer
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdftypes import resolve1
+    PDFMINER_AVAILABLE = True
+except ImportError:
+    PDFMINER_AVAILABLE = False
+
+# Optional in-process OCR: tesserocr (tessdata model loaded once per document) on pages rendered
+# by PDFium, or by pdf2image into memory when PDFium is not installed
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+FAST_OCR_AVAILABLE = TESSEROCR_AVAILABLE and (PDFIUM_AVAILABLE or OCR_AVAILABLE)
+
+PDF_OCR_AVAILABLE = OCR_AVAILABLE or FAST_OCR_AVAILABLE
+
+# Každý tesseract poběží jednovláknově - paralelizujeme po stránkách (viz extract_text_from_pdf_with_ocr)
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+OCR_MAX_WORKERS = min(4, os.cpu_count() or 1)  # Strop kvůli paměti při vyšším DPI
+OCR_ADAPTIVE_DPI = True  # Široké stránky vykreslíme s nižším DPI, krátký (ale neprázdný) výsledek zkusíme s vyšším
+OCR_RETRY_DPI = 300
+OCR_MIN_TEXT_LENGTH = 50  # Počet znaků, pod kterým výsledek OCR považujeme za nedostatečný
+OCR_WIDE_PAGE_PX = 2000  # Stránka širší než toto (v pixelech při zvoleném DPI) se vykreslí s OCR_WIDE_PAGE_DPI
+OCR_WIDE_PAGE_DPI = 150
+OCR_LANG = 'ces+eng'  # Czech and English language models
+OCR_DEFAULT_PSM = 3  # Tesseract page segmentation mode: 3 = automatic layout analysis, 6 = single uniform text block
+
+# Cesta k antiword pro .doc soubory (None, pokud není nainstalován) - zjišťujeme jen jednou při importu
+ANTIWORD_PATH = shutil.which('antiword')
+
+# Import pyarrow for fast multithreaded CSV reading (with pandas fallback if not installed)
+try:
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Import zstandard for parse cache compression (with zlib fallback if not installed)
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Import orjson for faster JSON parsing and pretty-printing (with json module fallback if not installed)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Import ijson for streaming large JSON arrays (with full in-memory parsing fallback if not installed)
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -75,6 +164,259 @@ except Exception as e:
     logging.error(f"Error configuring Gemini API: {e}")
     gemini_api_key = None # Ensure it's None if config fails
 
+# --- Parse Cache ---
+# Extracted text is cached on disk by SHA256 of the file content, so re-parsing an identical
+# file skips PyPDF2/OCR/pandas entirely. Bump a parser's version tag whenever its output changes.
+PARSE_CACHE_ENABLED = os.environ.get("CONVERTOR_PARSE_CACHE", "1") != "0"
+PARSE_CACHE_DIR = os.environ.get("CONVERTOR_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "jhdadfjkaf")
+PARSE_CACHE_SUFFIX = ".txt.zst" if ZSTD_AVAILABLE else ".txt.z"
+PARSE_CACHE_MAX_AGE_DAYS = float(os.environ.get("CONVERTOR_CACHE_MAX_AGE_DAYS", "30"))  # Nepoužité déle než toto se mažou
+PARSE_CACHE_MAX_SIZE_MB = float(os.environ.get("CONVERTOR_CACHE_MAX_SIZE_MB", "1024"))  # Nad tento limit se mažou nejstarší
+FINGERPRINT_CACHE_SIZE = 256  # Počet souborů, jejichž SHA256 si pamatujeme v rámci procesu
+HASH_CHUNK_SIZE = 1024 * 1024  # Soubor hashujeme po 1 MiB
+
+_fingerprint_cache = OrderedDict()  # (path, size, mtime_ns) -> sha256
+_fingerprint_lock = threading.Lock()
+_parse_state = threading.local()  # Příznak "výsledek nekešovat" pro právě běžící parser v tomto vlákně
+
+def file_fingerprint(file_path):
+    """
+    Returns the SHA256 hex digest of the file content.
+
+    The digest is remembered in a small in-process LRU keyed by (path, size, mtime_ns),
+    so repeated calls for an unchanged file don't re-hash it.
+    """
+    stat = os.stat(file_path)
+    fast_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    with _fingerprint_lock:
+        sha = _fingerprint_cache.get(fast_key)
+        if sha is not None:
+            _fingerprint_cache.move_to_end(fast_key)
+            return sha
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    sha = digest.hexdigest()
+
+    with _fingerprint_lock:
+        _fingerprint_cache[fast_key] = sha
+        if len(_fingerprint_cache) > FINGERPRINT_CACHE_SIZE:
+            _fingerprint_cache.popitem(last=False)
+    return sha
+
+def _compress_cached_text(text):
+    data = text.encode('utf-8')
+    if ZSTD_AVAILABLE:
+        return zstandard.ZstdCompressor().compress(data)
+    return zlib.compress(data)
+
+def _decompress_cached_text(data):
+    if ZSTD_AVAILABLE:
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    return zlib.decompress(data).decode('utf-8')
+
+def _read_cache_file(cache_path):
+    """Returns the text stored in a cache file, or None if there is no (readable) entry."""
+    try:
+        with open(cache_path, 'rb') as f:
+            text = _decompress_cached_text(f.read())
+    except FileNotFoundError:
+        return None
+    except Exception as cache_err:
+        logging.warning(f"Ignoring unreadable cache entry {cache_path}: {cache_err}")
+        return None
+    # Zásah posune mtime, takže prune_cache() maže nejdéle nepoužité položky
+    with contextlib.suppress(OSError):
+        os.utime(cache_path)
+    return text
+
+def _write_cache_file(cache_path, text):
+    """Stores text in a cache file atomically (temporary file + os.replace); failures are only logged."""
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(_compress_cached_text(text))
+        os.replace(tmp_path, cache_path)
+    except OSError as cache_err:
+        logging.warning(f"Could not write cache entry {cache_path}: {cache_err}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+def prune_cache(max_age_days=None, max_size_mb=None):
+    """
+    Removes old entries from the parse cache, including cached Gemini outputs in its 'ai' subdirectory.
+
+    Entries not used for max_age_days are deleted first; if the cache is still larger than
+    max_size_mb, the least recently used entries are deleted until it fits.
+    Returns the number of deleted files.
+    """
+    if max_age_days is None:
+        max_age_days = PARSE_CACHE_MAX_AGE_DAYS
+    if max_size_mb is None:
+        max_size_mb = PARSE_CACHE_MAX_SIZE_MB
+
+    entries = []
+    for root, _dirs, files in os.walk(PARSE_CACHE_DIR):
+        for name in files:
+            if not name.endswith((PARSE_CACHE_SUFFIX, ".tmp")):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+
+    cutoff = time.time() - max_age_days * 24 * 60 * 60
+    total_size = sum(size for _mtime, size, _path in entries)
+    max_size = max_size_mb * 1024 * 1024
+    removed = 0
+    for mtime, size, path in entries:
+        if mtime >= cutoff and total_size <= max_size:
+            break  # Zbývající položky jsou novější a cache se už vejde do limitu
+        try:
+            os.remove(path)
+        except OSError as remove_err:
+            logging.warning(f"Could not remove cache entry {path}: {remove_err}")
+            continue
+        total_size -= size
+        removed += 1
+
+    if removed:
+        logging.info(f"Pruned {removed} parse/AI cache entries from {PARSE_CACHE_DIR}")
+    return removed
+
+def _mark_parse_uncacheable():
+    """Marks the result of the running parser as not cacheable (a page, sheet or OCR step failed and was skipped)."""
+    _parse_state.uncacheable = True
+
+def cached_parse(version_tag):
+    """
+    Decorator caching the text returned by a parse_*_file function on disk.
+
+    The cache entry is keyed by the file's SHA256, the parser name and version_tag
+    (plus the call arguments, if any), and written atomically via os.replace.
+    Only non-empty string results are cached, and only if the parser did not call
+    _mark_parse_uncacheable(); exceptions propagate unchanged.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(file_path, *args, **kwargs):
+            if not PARSE_CACHE_ENABLED:
+                return func(file_path, *args, **kwargs)
+
+            try:
+                key = f"{file_fingerprint(file_path)}.{func.__name__}-{version_tag}"
+                if args or kwargs:
+                    call_args = repr((args, sorted(kwargs.items()))).encode('utf-8')
+                    key += "-" + hashlib.sha256(call_args).hexdigest()[:12]
+                cache_path = os.path.join(PARSE_CACHE_DIR, key + PARSE_CACHE_SUFFIX)
+            except OSError:
+                # Soubor nelze přečíst - chybu nahlásí samotný parser
+                return func(file_path, *args, **kwargs)
+
+            text = _read_cache_file(cache_path)
+            if text is not None:
+                logging.info(f"Using cached {func.__name__} result for {os.path.basename(file_path)}")
+                return text
+
+            outer_uncacheable = getattr(_parse_state, 'uncacheable', False)
+            _parse_state.uncacheable = False
+            try:
+                text = func(file_path, *args, **kwargs)
+                uncacheable = _parse_state.uncacheable
+            finally:
+                _parse_state.uncacheable = outer_uncacheable
+
+            # Prázdný výsledek nebo výsledek po přeskočené chybě se nekešuje - po doinstalování
+            # OCR/knihovny nebo opravě souboru se má parsovat znovu
+            if isinstance(text, str) and text.strip() and not uncacheable:
+                _write_cache_file(cache_path, text)
+            return text
+        return wrapper
+    return decorator
+
+class TextBuffer:
+    """
+    Collects text parts in a single io.StringIO, joined by newlines exactly like "\n".join(parts).
+
+    Parsers append pages/paragraphs as they are produced instead of keeping a list of strings.
+    """
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._has_parts = False
+
+    def open_part(self):
+        """Starts a new part and returns the underlying stream to write it into (e.g. DataFrame.to_string(buf=...))."""
+        if self._has_parts:
+            self._buffer.write("\n")
+        self._has_parts = True
+        return self._buffer
+
+    def append(self, text):
+        self.open_part().write(text)
+
+    def getvalue(self):
+        return self._buffer.getvalue()
+
+class HeadTailBuffer:
+    """
+    Collects a text stream of which only the start and end are shown when it gets long.
+
+    Up to max_chars everything is kept; past that only the first head_chars and (at least) the
+    last tail_chars characters are retained, so the middle of a huge document is never buffered.
+    """
+
+    def __init__(self, max_chars, head_chars, tail_chars):
+        self.max_chars = max_chars
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self._head = []
+        self._head_length = 0
+        self._tail = deque()
+        self._tail_length = 0
+        self._length = 0
+
+    def write(self, text):
+        self._length += len(text)
+        if self._head_length < self.head_chars:
+            self._head.append(text)
+            self._head_length += len(text)
+            return
+        self._tail.append(text)
+        self._tail_length += len(text)
+        if self._length > self.max_chars:
+            # The middle will be cut anyway - drop parts no longer needed for the tail
+            while len(self._tail) > 1 and self._tail_length - len(self._tail[0]) >= self.tail_chars:
+                self._tail_length -= len(self._tail.popleft())
+
+    def __len__(self):
+        return self._length
+
+    def is_truncated(self):
+        return self._length > self.max_chars
+
+    def getvalue(self):
+        """Returns the whole text (only complete while not is_truncated())."""
+        return "".join(self._head) + "".join(self._tail)
+
+    def head(self):
+        return "".join(self._head)[:self.head_chars]
+
+    def tail(self):
+        tail_text = "".join(self._tail)
+        if len(tail_text) < self.tail_chars:
+            # Nothing was dropped yet, the tail reaches back into the head
+            tail_text = "".join(self._head) + tail_text
+        return tail_text[-self.tail_chars:]
+
 # --- File Parsing Functions (Placeholders) ---
 
 def parse_text_file(file_path):
@@ -86,12 +428,100 @@ def parse_text_file(file_path):
         logging.error(f"Error parsing text file {file_path}: {e}")
         raise
 
-def extract_text_from_pdf_with_ocr(file_path, max_pages=3, dpi=200):
+def _ocr_page_dpi(page_width_pt, dpi):
+    """
+    Returns the DPI for rendering one page for OCR.
+
+    The page width in points is known before rendering (1 pt = 1/72 in), so pages that
+    would come out wider than OCR_WIDE_PAGE_PX are rendered at OCR_WIDE_PAGE_DPI instead.
+    Passes at OCR_RETRY_DPI or above are the deliberate high-resolution retry and keep their DPI.
+    """
+    if OCR_ADAPTIVE_DPI and dpi < OCR_RETRY_DPI and page_width_pt * dpi / 72 > OCR_WIDE_PAGE_PX:
+        return min(dpi, OCR_WIDE_PAGE_DPI)
+    return dpi
+
+def _pdf_page_widths(file_path, max_pages):
+    """Returns the widths in points (rotation applied) of the first max_pages pages, read from their PyPDF2 mediaboxes."""
+    with open_pdf_stream(file_path) as f:
+        reader = PyPDF2.PdfReader(f)
+        widths = []
+        for page in itertools.islice(reader.pages, max_pages or None):
+            box = page.mediabox
+            widths.append(float(box.height if page.rotation % 180 == 90 else box.width))
+    return widths
+
+def _ocr_dpi_runs(page_widths, dpi):
+    """Groups consecutive pages rendered at the same DPI into [first_page, last_page, dpi] runs (1-based, as pdf2image expects)."""
+    runs = []
+    for page_number, page_width in enumerate(page_widths, start=1):
+        page_dpi = _ocr_page_dpi(page_width, dpi)
+        if runs and runs[-1][2] == page_dpi:
+            runs[-1][1] = page_number
+        else:
+            runs.append([page_number, page_number, page_dpi])
+    return runs
+
+def _render_pdf_pages(file_path, max_pages, dpi):
+    """Yields the first max_pages pages of a PDF as PIL images rendered by PDFium (wide pages at a lower DPI, see _ocr_page_dpi)."""
+    pdf = pypdfium2.PdfDocument(file_path)
+    try:
+        page_count = len(pdf)
+        pages_to_render = min(page_count, max_pages) if max_pages else page_count
+        for i in range(pages_to_render):
+            page = pdf[i]
+            try:
+                page_dpi = _ocr_page_dpi(page.get_size()[0], dpi)
+                yield page.render(scale=page_dpi / 72, grayscale=True).to_pil()
+            finally:
+                page.close()
+    finally:
+        pdf.close()
+
+OCR_RENDER_BATCH_PAGES = 4  # Kolik stránek pdf2image vykreslí do paměti najednou
+
+def _render_pdf_pages_pdf2image(file_path, max_pages, dpi):
+    """
+    Yields the first max_pages pages of a PDF as grayscale PIL images rendered by pdf2image.
+
+    Pages are rendered as uncompressed PPM straight into memory (no image files, no PNG
+    encode/decode), a few pages per pdftoppm run to keep memory bounded. Wide pages are
+    rendered at a lower DPI (see _ocr_page_dpi).
+    """
+    for run_first, run_last, page_dpi in _ocr_dpi_runs(_pdf_page_widths(file_path, max_pages), dpi):
+        for first_page in range(run_first, run_last + 1, OCR_RENDER_BATCH_PAGES):
+            last_page = min(first_page + OCR_RENDER_BATCH_PAGES - 1, run_last)
+            yield from pdf2image.convert_from_path(
+                file_path,
+                dpi=page_dpi,
+                fmt="ppm",
+                grayscale=True,
+                first_page=first_page,
+                last_page=last_page
+            )
+
+def _extract_text_from_pdf_in_process(file_path, max_pages, dpi, psm=OCR_DEFAULT_PSM):
+    """OCR via in-memory page images and a single tesserocr API instance (no tesseract subprocesses)."""
+    render_pages = _render_pdf_pages if PDFIUM_AVAILABLE else _render_pdf_pages_pdf2image
+    text_parts = []
+    with tesserocr.PyTessBaseAPI(lang=OCR_LANG, psm=psm) as api:
+        for i, img in enumerate(render_pages(file_path, max_pages, dpi)):
+            logging.info(f"Performing in-process OCR on page {i+1}")
+            api.SetImage(img)
+            page_text = api.GetUTF8Text()
+            if page_text.strip():
+                text_parts.append(page_text)
+            else:
+                logging.warning(f"OCR could not extract text from page {i+1}")
+    return text_parts
+
+def extract_text_from_pdf_with_ocr(file_path, max_pages=3, dpi=200, psm=OCR_DEFAULT_PSM):
     """
     Extracts text from PDF using OCR (Optical Character Recognition).
 
     This function is used as a fallback when regular text extraction fails.
     It converts PDF pages to images and then uses pytesseract to extract text.
+    If tesserocr is installed, pages are rendered into memory (by PDFium if installed,
+    otherwise by pdf2image) and recognized in-process instead (falling back to pytesseract on error).
 
     Default max_pages is set to 3 to avoid processing too many pages at once,
     which can cause performance issues or timeouts.
@@ -100,6 +530,11 @@ def extract_text_from_pdf_with_ocr(file_path, max_pages=3, dpi=200):
         file_path (str): Path to the PDF file
         max_pages (int, optional): Maximum number of pages to process. Defaults to 3 pages.
         dpi (int, optional): DPI for image conversion. Defaults to 200 for balance of quality and speed.
+            If OCR_ADAPTIVE_DPI is set, pages wider than OCR_WIDE_PAGE_PX at this DPI are rendered at
+            OCR_WIDE_PAGE_DPI, and a result that has some text but less than OCR_MIN_TEXT_LENGTH
+            characters is retried at OCR_RETRY_DPI.
+        psm (int, optional): Tesseract page segmentation mode. Defaults to 3 (automatic layout analysis).
+            Callers with known single-column content (invoices, plain reports) can pass 6 to skip layout analysis.
 
     Returns:
         str: Extracted text content from the PDF file
@@ -108,47 +543,111 @@ def extract_text_from_pdf_with_ocr(file_path, max_pages=3, dpi=200):
         ImportError: If OCR libraries are not available
         Exception: For other unexpected errors
     """
+    result = _run_pdf_ocr(file_path, max_pages, dpi, psm)
+
+    # Adaptive DPI: retry at a higher resolution only when the first pass found a little text - a blank
+    # or image-only PDF with no text at all would just pay for a second full OCR pass
+    if OCR_ADAPTIVE_DPI and dpi < OCR_RETRY_DPI and 0 < len((result or "").strip()) < OCR_MIN_TEXT_LENGTH:
+        logging.info(f"OCR at {dpi} DPI returned too little text, retrying at {OCR_RETRY_DPI} DPI: {os.path.basename(file_path)}")
+        retry_result = _run_pdf_ocr(file_path, max_pages, OCR_RETRY_DPI, psm)
+        if len((retry_result or "").strip()) > len((result or "").strip()):
+            result = retry_result
+
+    return result
+
+def _run_pdf_ocr(file_path, max_pages, dpi, psm=OCR_DEFAULT_PSM):
+    """Runs one OCR pass over the PDF at the given DPI and page segmentation mode (see extract_text_from_pdf_with_ocr)."""
+    if FAST_OCR_AVAILABLE:
+        try:
+            logging.info(f"Performing in-process OCR (tesserocr): {os.path.basename(file_path)}")
+            result = "\n".join(_extract_text_from_pdf_in_process(file_path, max_pages, dpi, psm))
+            if not result.strip():
+                logging.warning("OCR did not extract any text from the PDF")
+                return None
+            logging.info(f"Successfully extracted {len(result)} characters with OCR")
+            return result
+        except Exception as fast_ocr_error:
+            if not OCR_AVAILABLE:
+                logging.error(f"Error during OCR processing: {fast_ocr_error}")
+                raise
+            logging.warning(f"In-process OCR failed, falling back to pytesseract: {fast_ocr_error}")
+
     if not OCR_AVAILABLE:
         logging.error("OCR libraries not available. Cannot perform OCR on PDF.")
         raise ImportError("OCR libraries (pytesseract/pdf2image) not installed. Please install them to use OCR functionality.")
 
     text_parts = []
+    tesseract_config = f'--psm {psm}'
 
     try:
         logging.info(f"Converting PDF to images for OCR: {os.path.basename(file_path)}")
 
         # Create a temporary directory for the images
         with tempfile.TemporaryDirectory() as temp_dir:
-            # Convert PDF to images
-            images = pdf2image.convert_from_path(
-                file_path,
-                dpi=dpi,
-                output_folder=temp_dir,
-                fmt="png",
-                thread_count=4  # Use multiple threads for faster conversion
-            )
-
-            # Limit the number of pages if specified
-            if max_pages:
-                images = images[:max_pages]
-
-            total_pages = len(images)
+            # Convert PDF to image files - only the pages we will OCR, without loading them into PIL;
+            # one pdftoppm run per group of consecutive pages sharing a DPI (wide pages get a lower one)
+            image_paths = []
+            for first_page, last_page, page_dpi in _ocr_dpi_runs(_pdf_page_widths(file_path, max_pages), dpi):
+                image_paths.extend(pdf2image.convert_from_path(
+                    file_path,
+                    dpi=page_dpi,
+                    output_folder=temp_dir,
+                    fmt="tiff",  # Uncompressed images are the fastest input for tesseract
+                    grayscale=True,  # 8-bit grayscale is all tesseract needs for text
+                    thread_count=4,  # Use multiple threads for faster conversion
+                    first_page=first_page,
+                    last_page=last_page,
+                    paths_only=True
+                ))
+
+            total_pages = len(image_paths)
             logging.info(f"Processing {total_pages} pages with OCR")
 
-            # Process each image with OCR
-            for i, img in enumerate(images):
+            def ocr_page(i, image_path):
                 try:
                     logging.info(f"Performing OCR on page {i+1}/{total_pages}")
 
                     # Use pytesseract to extract text from the image
-                    page_text = pytesseract.image_to_string(img, lang='ces+eng')  # Use Czech and English languages
-
-                    if page_text.strip():
-                        text_parts.append(page_text)
-                    else:
-                        logging.warning(f"OCR could not extract text from page {i+1}")
+                    return pytesseract.image_to_string(image_path, lang=OCR_LANG, config=tesseract_config)
                 except Exception as ocr_error:
                     logging.error(f"OCR error on page {i+1}: {ocr_error}")
+                    return None
+
+            def ocr_page_batch(batch):
+                # Jeden běh tesseractu pro celou dávku stránek (seznam souborů) - model se načte jen jednou
+                first_page = batch[0][0]
+                try:
+                    logging.info(f"Performing OCR on pages {first_page+1}-{batch[-1][0]+1}/{total_pages}")
+                    list_path = os.path.join(temp_dir, f"ocr_pages_{first_page}.txt")
+                    with open(list_path, 'w', encoding='utf-8') as list_file:
+                        list_file.write("\n".join(image_path for _, image_path in batch) + "\n")
+
+                    # Tesseract odděluje stránky znakem form feed (výchozí page_separator)
+                    page_texts = pytesseract.image_to_string(list_path, lang=OCR_LANG, config=tesseract_config).split('\f')
+                    if len(page_texts) < len(batch):
+                        raise ValueError(f"expected {len(batch)} pages, got {len(page_texts)}")
+                    return page_texts[:len(batch)]
+                except Exception as batch_error:
+                    logging.warning(f"Batch OCR failed for pages starting at {first_page+1}, falling back to per-page OCR: {batch_error}")
+                    return [ocr_page(i, image_path) for i, image_path in batch]
+
+            # Split pages into contiguous batches processed in parallel - each tesseract subprocess releases the GIL while it runs
+            pages = list(enumerate(image_paths))
+            batch_count = max(1, min(total_pages, OCR_MAX_WORKERS))
+            batch_size = -(-total_pages // batch_count) if total_pages else 1
+            batches = [pages[start:start + batch_size] for start in range(0, total_pages, batch_size)]
+
+            page_texts = []
+            with ThreadPoolExecutor(max_workers=batch_count) as ocr_executor:
+                for batch_texts in ocr_executor.map(ocr_page_batch, batches):
+                    page_texts.extend(batch_texts)
+
+            # Keep page order
+            for i, page_text in enumerate(page_texts):
+                if page_text and page_text.strip():
+                    text_parts.append(page_text)
+                elif page_text is not None:
+                    logging.warning(f"OCR could not extract text from page {i+1}")
 
         # Join all text parts with newlines
         result = "\n".join(text_parts)
@@ -164,9 +663,124 @@ def extract_text_from_pdf_with_ocr(file_path, max_pages=3, dpi=200):
         logging.error(f"Error during OCR processing: {e}")
         raise
 
+MMAP_PDF_MAX_BYTES = 500 * 1024 * 1024  # Větší soubory čteme klasicky přes buffer
+
+@contextlib.contextmanager
+def open_pdf_stream(file_path):
+    """
+    Opens a PDF for PyPDF2 as a read-only memory map.
+
+    PyPDF2 does many small seeks/reads; on a memory map they are served from the page cache
+    without buffered-file copies. Empty and very large files fall back to a plain file object.
+    """
+    with open(file_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size == 0 or file_size > MMAP_PDF_MAX_BYTES:
+            yield f
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+def pdf_page_count(reader):
+    """
+    Returns the page count of a PyPDF2 reader from the page tree root's /Count entry.
+
+    Only worth it when the caller never touches reader.pages: any access to reader.pages
+    (len, indexing or iteration) flattens the whole page tree, and then len(reader.pages)
+    is free and exact. Falls back to len(reader.pages) when the entry is missing or malformed.
+    """
+    try:
+        count = reader.trailer['/Root']['/Pages']['/Count']
+        if isinstance(count, int) and count >= 0:
+            return int(count)
+    except Exception as count_err:
+        logging.debug(f"PDF page tree has no usable /Count, counting pages: {count_err}")
+    return len(reader.pages)
+
+def _extract_pdf_text_fast(file_path, max_pages):
+    """
+    Extracts page texts with PDFium's native text extractor.
+
+    Pages and text pages are closed explicitly to free the C memory right away.
+    Returns a tuple (page_texts, total_pages) with page_texts in page order.
+    """
+    pdf = pypdfium2.PdfDocument(file_path)
+    try:
+        total_pages = len(pdf)
+        pages_to_process = min(total_pages, max_pages) if max_pages else total_pages
+        page_texts = []
+        for i in range(pages_to_process):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            try:
+                page_texts.append(textpage.get_text_range().replace('\r\n', '\n'))
+            except Exception as page_e:
+                logging.error(f"Error extracting text from page {i+1} of {file_path}: {page_e}")
+                page_texts.append(None)
+            finally:
+                textpage.close()
+                page.close()
+        return page_texts, total_pages
+    finally:
+        pdf.close()
+
+def _pdfminer_page_count(document):
+    """Returns the page count of a pdfminer PDFDocument from /Count, walking the page tree only if /Count is unusable."""
+    try:
+        count = resolve1(resolve1(document.catalog['Pages']).get('Count'))
+        if isinstance(count, int) and count > 0:
+            return count
+    except Exception as count_err:
+        logging.debug(f"PDF page tree has no usable /Count, counting pages: {count_err}")
+    return sum(1 for _ in PDFPage.create_pages(document))
+
+def _extract_pdf_text_pdfminer(file_path, max_pages):
+    """
+    Extracts page texts with pdfminer.six in a single pass over the document.
+
+    This is what pdfminer.high_level.extract_pages does, but the page count comes from
+    the same PDFDocument and the page tree walk stops after the last needed page. Each
+    page's text is built from its LTTextContainers, so a form feed inside the page text
+    cannot shift the pages. Returns a tuple (page_texts, total_pages) in page order.
+    """
+    with open(file_path, 'rb') as f:
+        document = PDFDocument(PDFParser(f))
+        total_pages = _pdfminer_page_count(document)
+        pages_to_process = min(total_pages, max_pages) if max_pages else total_pages
+
+        resource_manager = PDFResourceManager()
+        device = PDFPageAggregator(resource_manager, laparams=LAParams())
+        interpreter = PDFPageInterpreter(resource_manager, device)
+        page_texts = []
+        for page in itertools.islice(PDFPage.create_pages(document), pages_to_process):
+            interpreter.process_page(page)
+            layout = device.get_result()
+            page_texts.append("".join(element.get_text() for element in layout if isinstance(element, LTTextContainer)))
+    return page_texts, total_pages
+
+OCR_PROBE_PAGES = 2  # Po tolika stránkách posoudíme, zda má PDF použitelnou textovou vrstvu
+OCR_MIN_ALNUM_CHARS = 50  # Méně alfanumerických znaků na prvních stránkách = nejspíš sken
+
+def _try_pdf_ocr(file_path, max_pages):
+    """Runs the OCR fallback for a PDF; returns the OCR text, or None if OCR failed or found nothing."""
+    try:
+        ocr_result = extract_text_from_pdf_with_ocr(file_path, max_pages)
+        if ocr_result:
+            logging.info(f"Successfully extracted text using OCR: {os.path.basename(file_path)}")
+            return ocr_result
+        logging.warning(f"OCR also failed to extract text from PDF: {os.path.basename(file_path)}")
+    except ImportError as ie:
+        logging.warning(f"OCR libraries not available: {ie}")
+        _mark_parse_uncacheable()
+    except Exception as ocr_e:
+        logging.error(f"Error during OCR processing: {ocr_e}")
+        _mark_parse_uncacheable()
+    return None
+
+@cached_parse("10")
 def parse_pdf_file(file_path, max_pages=5, page_batch_size=5, try_ocr=True):
     """
-    Parses PDF files using PyPDF2 with OCR fallback.
+    Parses PDF files using PDFium (if pypdfium2 is installed), pdfminer.six (if installed) or PyPDF2, with OCR fallback.
 
     Optimized for large files with batch processing and progress logging.
     If regular text extraction fails and try_ocr is True, falls back to OCR.
@@ -188,28 +802,64 @@ def parse_pdf_file(file_path, max_pages=5, page_batch_size=5, try_ocr=True):
         IOError: If there's an issue reading the file
         Exception: For other unexpected errors
     """
-    text_parts = []  # Store text in parts to avoid large string concatenation
+    text_parts = TextBuffer()  # Stream text parts into one buffer to avoid large string concatenation
+    ocr_attempted = False
     try:
         # Check file size before processing
         file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
 
-        with open(file_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            total_pages = len(reader.pages)
+        # Prefer PDFium's native text extraction (or pdfminer.six), PyPDF2 stays as a fallback
+        page_texts = None
+        if PDFIUM_AVAILABLE:
+            try:
+                page_texts, total_pages = _extract_pdf_text_fast(file_path, max_pages)
+                pages_to_process = len(page_texts)
+                logging.info(f"Parsed PDF with PDFium: {os.path.basename(file_path)} ({pages_to_process} of {total_pages} pages, {file_size_mb:.2f}MB)")
+            except pypdfium2.PdfiumError as pdfium_err:
+                logging.warning(f"PDFium could not read {os.path.basename(file_path)}, falling back to PyPDF2: {pdfium_err}")
+                page_texts = None
+        elif PDFMINER_AVAILABLE:
+            try:
+                page_texts, total_pages = _extract_pdf_text_pdfminer(file_path, max_pages)
+                pages_to_process = len(page_texts)
+                logging.info(f"Parsed PDF with pdfminer: {os.path.basename(file_path)} ({pages_to_process} of {total_pages} pages, {file_size_mb:.2f}MB)")
+            except Exception as pdfminer_err:
+                logging.warning(f"pdfminer could not read {os.path.basename(file_path)}, falling back to PyPDF2: {pdfminer_err}")
+                page_texts = None
+
+        if page_texts is not None:
+            for i, page_text in enumerate(page_texts):
+                if page_text and page_text.strip():
+                    text_parts.append(page_text)
+                elif page_text is not None:
+                    logging.warning(f"Could not extract text from page {i+1} of {os.path.basename(file_path)}")
+                else:
+                    _mark_parse_uncacheable()
+        else:
+            with open_pdf_stream(file_path) as f:
+                reader = PyPDF2.PdfReader(f)
+                # The loop below walks reader.pages, which flattens the page tree anyway - so use the
+                # real page count rather than an unchecked /Count (see pdf_page_count)
+                total_pages = len(reader.pages)
+
+                # Determine how many pages to process
+                pages_to_process = min(total_pages, max_pages) if max_pages else total_pages
 
-            # Determine how many pages to process
-            pages_to_process = min(total_pages, max_pages) if max_pages else total_pages
+                logging.info(f"Parsing PDF: {os.path.basename(file_path)} ({pages_to_process} of {total_pages} pages, {file_size_mb:.2f}MB)")
 
-            logging.info(f"Parsing PDF: {os.path.basename(file_path)} ({pages_to_process} of {total_pages} pages, {file_size_mb:.2f}MB)")
+                # After the first pages, check whether the PDF has a usable text layer at all;
+                # a scanned PDF goes straight to OCR instead of walking all remaining pages
+                probe_for_ocr = try_ocr and PDF_OCR_AVAILABLE and pages_to_process > OCR_PROBE_PAGES
 
-            # Process pages in batches to avoid memory issues with large PDFs
-            for batch_start in range(0, pages_to_process, page_batch_size):
-                batch_end = min(batch_start + page_batch_size, pages_to_process)
-                logging.info(f"Processing PDF pages {batch_start+1}-{batch_end} of {pages_to_process}")
+                # Walk the pages once in order, logging progress per batch of pages
+                for i, page in enumerate(reader.pages):
+                    if i >= pages_to_process:
+                        break
+                    if i % page_batch_size == 0:
+                        batch_end = min(i + page_batch_size, pages_to_process)
+                        logging.info(f"Processing PDF pages {i+1}-{batch_end} of {pages_to_process}")
 
-                for i in range(batch_start, batch_end):
                     try:
-                        page = reader.pages[i]
                         page_text = page.extract_text()
                         if page_text:
                             text_parts.append(page_text)
@@ -217,31 +867,34 @@ def parse_pdf_file(file_path, max_pages=5, page_batch_size=5, try_ocr=True):
                             logging.warning(f"Could not extract text from page {i+1} of {os.path.basename(file_path)}")
                     except Exception as page_e:
                         logging.error(f"Error extracting text from page {i+1} of {file_path}: {page_e}")
+                        _mark_parse_uncacheable()
 
-            # Check if we processed all pages or limited the number
-            if total_pages > pages_to_process:
-                logging.info(f"Processed {pages_to_process} pages out of {total_pages} total pages in {os.path.basename(file_path)}")
-                text_parts.append(f"\n[Note: Only {pages_to_process} of {total_pages} pages were processed due to size limits]")
+                    if probe_for_ocr and i == OCR_PROBE_PAGES - 1:
+                        probe_for_ocr = False
+                        alnum_seen = sum(ch.isalnum() for ch in text_parts.getvalue())
+                        if alnum_seen < OCR_MIN_ALNUM_CHARS:
+                            logging.info(f"Only {alnum_seen} alphanumeric characters on the first {OCR_PROBE_PAGES} pages, trying OCR early: {os.path.basename(file_path)}")
+                            ocr_attempted = True
+                            ocr_result = _try_pdf_ocr(file_path, max_pages)
+                            if ocr_result:
+                                return ocr_result
 
-            logging.info(f"Successfully parsed PDF: {os.path.basename(file_path)}")
+        # Check if we processed all pages or limited the number
+        if total_pages > pages_to_process:
+            logging.info(f"Processed {pages_to_process} pages out of {total_pages} total pages in {os.path.basename(file_path)}")
+            text_parts.append(f"\n[Note: Only {pages_to_process} of {total_pages} pages were processed due to size limits]")
+
+        logging.info(f"Successfully parsed PDF: {os.path.basename(file_path)}")
 
         # Join all text parts with newlines
-        result = "\n".join(text_parts)
+        result = text_parts.getvalue()
 
-        # Check if we extracted any meaningful text
-        if not result.strip() and try_ocr and OCR_AVAILABLE:
-            logging.info(f"No text extracted from PDF using PyPDF2, trying OCR: {os.path.basename(file_path)}")
-            try:
-                ocr_result = extract_text_from_pdf_with_ocr(file_path, max_pages)
-                if ocr_result:
-                    logging.info(f"Successfully extracted text using OCR: {os.path.basename(file_path)}")
-                    return ocr_result
-                else:
-                    logging.warning(f"OCR also failed to extract text from PDF: {os.path.basename(file_path)}")
-            except ImportError as ie:
-                logging.warning(f"OCR libraries not available: {ie}")
-            except Exception as ocr_e:
-                logging.error(f"Error during OCR processing: {ocr_e}")
+        # Check if we extracted any meaningful text (unless OCR was already tried after the first pages)
+        if not result.strip() and try_ocr and PDF_OCR_AVAILABLE and not ocr_attempted:
+            logging.info(f"No text extracted from PDF, trying OCR: {os.path.basename(file_path)}")
+            ocr_result = _try_pdf_ocr(file_path, max_pages)
+            if ocr_result:
+                return ocr_result
 
         # For very large content, provide a summary of the extraction
         if len(result) > 1000000:  # If more than ~1MB of text
@@ -253,7 +906,7 @@ def parse_pdf_file(file_path, max_pages=5, page_batch_size=5, try_ocr=True):
         logging.error(f"Invalid PDF file {file_path}: {pdf_err}")
 
         # Try OCR as a fallback for corrupted PDFs
-        if try_ocr and OCR_AVAILABLE:
+        if try_ocr and PDF_OCR_AVAILABLE:
             logging.info(f"PDF reading error, trying OCR as fallback: {os.path.basename(file_path)}")
             try:
                 ocr_result = extract_text_from_pdf_with_ocr(file_path, max_pages)
@@ -272,6 +925,57 @@ def parse_pdf_file(file_path, max_pages=5, page_batch_size=5, try_ocr=True):
         raise  # Re-raise to be caught by process_file
 
 
+# Typické hlavičky emailové korespondence (každá se v odstavci počítá jen jednou)
+EMAIL_INDICATOR_RE = re.compile(r'(?:Od|Odesílatel|From|Komu|To|Předmět|Subject):')
+EMAIL_INDICATOR_THRESHOLD = 3
+EMAIL_SCAN_PARAGRAPHS = 50
+
+def looks_like_email_correspondence(paragraphs):
+    """
+    Checks the first EMAIL_SCAN_PARAGRAPHS paragraphs for email header indicators.
+
+    Stops as soon as EMAIL_INDICATOR_THRESHOLD indicators are found.
+
+    Args:
+        paragraphs: Iterable of python-docx paragraphs
+
+    Returns:
+        bool: True if the document is likely email correspondence
+    """
+    email_indicator_count = 0
+    for para in itertools.islice(paragraphs, EMAIL_SCAN_PARAGRAPHS):
+        email_indicator_count += len(set(EMAIL_INDICATOR_RE.findall(para.text)))
+        if email_indicator_count >= EMAIL_INDICATOR_THRESHOLD:
+            return True
+    return False
+
+def iter_docx_table_rows(tbl):
+    """
+    Yields the stripped cell texts of each row of a <w:tbl> element.
+
+    Works directly on the XML elements instead of python-docx Row/Cell wrappers, with the same
+    semantics as row.cells: a horizontally merged cell is repeated for each grid column it spans
+    and a vertically merged continuation cell repeats the text of the cell above.
+    """
+    cells_above = {}  # sloupec mřížky -> text buňky v předchozím řádku
+    for tr in tbl.iterchildren(qn('w:tr')):
+        row_texts = []
+        row_cells = {}
+        grid_col = tr.grid_before
+        for tc in tr.iterchildren(qn('w:tc')):
+            span = tc.grid_span
+            if tc.vMerge == "continue":
+                cell_text = cells_above.get(grid_col, "")
+            else:
+                cell_text = "\n".join(p.text for p in tc.iterchildren(qn('w:p'))).strip()
+            for offset in range(span):
+                row_texts.append(cell_text)
+                row_cells[grid_col + offset] = cell_text
+            grid_col += span
+        cells_above = row_cells
+        yield row_texts
+
+@cached_parse("2")
 def parse_docx_file(file_path, include_tables=True, batch_size=100, max_pages=None):
     """
     Parses DOCX files using python-docx.
@@ -293,7 +997,7 @@ def parse_docx_file(file_path, include_tables=True, batch_size=100, max_pages=No
         IOError: If there's an issue reading the file
         Exception: For other unexpected errors
     """
-    text_parts = []  # Store text in parts to avoid large string concatenation
+    text_parts = TextBuffer()  # Stream text parts into one buffer to avoid large string concatenation
     try:
         # Check file size before processing
         file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
@@ -306,7 +1010,9 @@ def parse_docx_file(file_path, include_tables=True, batch_size=100, max_pages=No
             raise ValueError(f"Invalid DOCX format: {doc_error}")
 
         # Process paragraphs in batches
-        total_paragraphs = len(doc.paragraphs)
+        # doc.paragraphs builds a new list on every access - materialize it once
+        paragraphs = doc.paragraphs
+        total_paragraphs = len(paragraphs)
         logging.info(f"DOCX contains {total_paragraphs} paragraphs")
 
         # Odhadneme počet stránek na základě počtu odstavců (přibližně 20 odstavců na stránku)
@@ -322,61 +1028,48 @@ def parse_docx_file(file_path, include_tables=True, batch_size=100, max_pages=No
         # Zpracujeme všechny odstavce, pokud se jedná o emailovou korespondenci
         # Emailová korespondence vyžaduje zpracování celého dokumentu pro správnou detekci
         # Zkontrolujeme, zda dokument obsahuje typické znaky emailové korespondence
-        email_indicators = ['Od:', 'Odesílatel:', 'From:', 'Komu:', 'To:', 'Předmět:', 'Subject:']
-        email_indicator_count = 0
-
-        # Zkontrolujeme prvních 50 odstavců (nebo méně, pokud jich je méně)
-        for i in range(min(50, total_paragraphs)):
-            para_text = doc.paragraphs[i].text
-            for indicator in email_indicators:
-                if indicator in para_text:
-                    email_indicator_count += 1
-
-        # Pokud najdeme alespoň 3 indikátory, považujeme to za emailovou korespondenci
-        is_likely_email = email_indicator_count >= 3
+        # (alespoň 3 indikátory v prvních 50 odstavcích)
+        is_likely_email = looks_like_email_correspondence(paragraphs)
 
         if is_likely_email:
             logging.info(f"Document appears to be email correspondence, processing all paragraphs")
             paragraphs_to_process = total_paragraphs
 
-        for batch_start in range(0, paragraphs_to_process, batch_size):
-            batch_end = min(batch_start + batch_size, paragraphs_to_process)
-            if total_paragraphs > 1000:  # Only log batches for large documents
-                logging.info(f"Processing DOCX paragraphs {batch_start+1}-{batch_end} of {paragraphs_to_process}")
+        for i, para in enumerate(itertools.islice(paragraphs, paragraphs_to_process)):
+            if total_paragraphs > 1000 and i % batch_size == 0:  # Only log batches for large documents
+                batch_end = min(i + batch_size, paragraphs_to_process)
+                logging.info(f"Processing DOCX paragraphs {i+1}-{batch_end} of {paragraphs_to_process}")
 
-            # Process this batch of paragraphs
-            for i in range(batch_start, batch_end):
-                try:
-                    para = doc.paragraphs[i]
-                    if para.text.strip():  # Only add non-empty paragraphs
-                        text_parts.append(para.text)
-                except Exception as para_error:
-                    logging.error(f"Error extracting text from paragraph {i+1}: {para_error}")
-
-        # Process tables if requested
-        if include_tables and doc.tables:
-            table_count = len(doc.tables)
+            try:
+                para_text = para.text
+                if para_text.strip():  # Only add non-empty paragraphs
+                    text_parts.append(para_text)
+            except Exception as para_error:
+                logging.error(f"Error extracting text from paragraph {i+1}: {para_error}")
+                _mark_parse_uncacheable()
+
+        # Process tables if requested (directly on the body XML, without python-docx table wrappers)
+        tables = list(doc.element.body.iterchildren(qn('w:tbl'))) if include_tables else []
+        if tables:
+            table_count = len(tables)
             logging.info(f"Processing {table_count} tables in DOCX")
 
-            for table_index, table in enumerate(doc.tables):
+            for table_index, tbl in enumerate(tables):
                 try:
                     # Add a header for the table
                     text_parts.append(f"\nTable {table_index + 1}:")
 
                     # Process each row
-                    for row in table.rows:
-                        row_texts = []
-                        for cell in row.cells:
-                            row_texts.append(cell.text.strip())
-
+                    for row_texts in iter_docx_table_rows(tbl):
                         # Join cells with tabs and add to text parts
                         if any(row_texts):  # Only add non-empty rows
                             text_parts.append("\t".join(row_texts))
                 except Exception as table_error:
                     logging.error(f"Error extracting text from table {table_index + 1}: {table_error}")
+                    _mark_parse_uncacheable()
 
         # Join all text parts with newlines
-        result = "\n".join(text_parts)
+        result = text_parts.getvalue()
 
         # For very large content, provide a summary of the extraction
         if len(result) > 1000000:  # If more than ~1MB of text
@@ -420,15 +1113,8 @@ def parse_doc_file(file_path):
     text = ""
     try:
         logging.info(f"Parsing DOC with antiword: {os.path.basename(file_path)}")
-        # Check if antiword is installed
-        try:
-            # Try to run antiword with --help to check if it's installed
-            subprocess.run(['antiword', '--help'], capture_output=True, check=False)
-            antiword_installed = True
-        except FileNotFoundError:
-            antiword_installed = False
-
-        if not antiword_installed:
+        # Check if antiword is installed (looked up on PATH once at import)
+        if ANTIWORD_PATH is None:
             # Antiword not installed - return a helpful message instead of raising an exception
             install_message = """
 Antiword is not installed. To process .doc files, please install antiword:
@@ -445,7 +1131,7 @@ Alternatively, consider converting your .doc file to .docx format which doesn't
         # Execute antiword, capture stdout, decode as UTF-8, ignore errors
         # Use '-m UTF-8' for UTF-8 output, '-w 0' for unlimited line width
         process = subprocess.run(
-            ['antiword', '-m', 'UTF-8', '-w', '0', file_path],
+            [ANTIWORD_PATH, '-m', 'UTF-8', '-w', '0', file_path],
             capture_output=True,
             text=True, # Decodes stdout/stderr using default encoding (usually utf-8)
             check=False # Don't raise exception on non-zero exit code, check manually
@@ -467,16 +1153,43 @@ Alternatively, consider converting your .doc file to .docx format which doesn't
         # Return error message instead of raising exception
         return f"Error processing .doc file: {str(e)}"
 
-def parse_xlsx_file(file_path, max_rows_per_sheet=1000, max_sheets=None):
+def _read_sheet_openpyxl(worksheet, max_rows, max_columns):
+    """
+    Reads only the requested rectangle of a read-only openpyxl worksheet.
+
+    Returns a tuple (DataFrame, total_columns, truncated) in the same shape pd.read_excel
+    would produce for the first max_rows data rows and max_columns columns.
+    """
+    header = next(worksheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+    # Trailing empty header cells are not columns (pandas drops them too)
+    while header and header[-1] is None:
+        header = header[:-1]
+    total_columns = max(len(header), worksheet.max_column or 0) if header else 0
+    columns = [str(value) if value is not None else f"Unnamed: {index}" for index, value in enumerate(header[:max_columns])]
+
+    rows = []
+    if columns:
+        for row in worksheet.iter_rows(min_row=2, max_row=max_rows + 2, max_col=len(columns), values_only=True):
+            if any(value is not None for value in row):
+                rows.append(list(row) + [None] * (len(columns) - len(row)))
+
+    truncated = len(rows) > max_rows
+    return pd.DataFrame(rows[:max_rows], columns=columns), total_columns, truncated
+
+@cached_parse("3")
+def parse_xlsx_file(file_path, max_rows_per_sheet=1000, max_sheets=None, use_pandas=None):
     """
     Parses Excel (.xlsx) files using pandas.
 
-    Optimized for large files with row and sheet limits.
+    Optimized for large files with row and sheet limits. Large .xlsx files (over 10MB)
+    are read with openpyxl in read-only mode, so only the first max_rows_per_sheet rows
+    and 10 columns of each sheet are parsed; smaller files and .xls keep the pandas path.
 
     Args:
         file_path (str): Path to the Excel file
         max_rows_per_sheet (int, optional): Maximum number of rows to process per sheet. Defaults to 1000.
         max_sheets (int, optional): Maximum number of sheets to process. If None, process all sheets.
+        use_pandas (bool, optional): Force (True) or disable (False) the pandas path. If None, chosen by file size and type.
 
     Returns:
         str: Formatted string representation of the Excel content
@@ -491,103 +1204,129 @@ def parse_xlsx_file(file_path, max_rows_per_sheet=1000, max_sheets=None):
         file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
         logging.info(f"Parsing Excel file: {os.path.basename(file_path)} ({file_size_mb:.2f}MB)")
 
+        if use_pandas is None:
+            use_pandas = file_size_mb <= 10 or not file_path.lower().endswith('.xlsx')
+
         # Get sheet names first to determine structure
         try:
-            excel_file = pd.ExcelFile(file_path)
-            sheet_names = excel_file.sheet_names
+            if use_pandas:
+                excel_file = pd.ExcelFile(file_path)
+                sheet_names = excel_file.sheet_names
+            else:
+                workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+                sheet_names = workbook.sheetnames
         except Exception as excel_error:
             logging.error(f"Failed to open Excel file {file_path}: {excel_error}")
             raise ValueError(f"Invalid Excel format: {excel_error}")
 
-        # Determine how many sheets to process
-        total_sheets = len(sheet_names)
-        sheets_to_process = min(total_sheets, max_sheets) if max_sheets else total_sheets
-
-        if sheets_to_process < total_sheets:
-            logging.info(f"Processing {sheets_to_process} of {total_sheets} sheets in Excel file")
-
-        # Initialize result text
-        text_parts = []
-        text_parts.append("Excel File Content:")
+        try:
+            # Determine how many sheets to process
+            total_sheets = len(sheet_names)
+            sheets_to_process = min(total_sheets, max_sheets) if max_sheets else total_sheets
 
-        # Add sheet information
-        if total_sheets > 1:
-            text_parts.append(f"File contains {total_sheets} sheets: {', '.join(sheet_names)}")
             if sheets_to_process < total_sheets:
-                text_parts.append(f"Note: Only processing first {sheets_to_process} sheets due to size limits.")
-            text_parts.append("")  # Empty line
+                logging.info(f"Processing {sheets_to_process} of {total_sheets} sheets in Excel file")
 
-        # Process each sheet up to the limit
-        for sheet_index, sheet_name in enumerate(sheet_names[:sheets_to_process]):
-            try:
-                logging.info(f"Processing Excel sheet {sheet_index+1}/{sheets_to_process}: {sheet_name}")
+            # Initialize result text
+            text_parts = TextBuffer()
+            text_parts.append("Excel File Content:")
 
-                # Read the sheet with row limits for large files
+            # Add sheet information
+            if total_sheets > 1:
+                text_parts.append(f"File contains {total_sheets} sheets: {', '.join(sheet_names)}")
+                if sheets_to_process < total_sheets:
+                    text_parts.append(f"Note: Only processing first {sheets_to_process} sheets due to size limits.")
+                text_parts.append("")  # Empty line
+
+            # Process each sheet up to the limit
+            for sheet_index, sheet_name in enumerate(sheet_names[:sheets_to_process]):
                 try:
-                    # First try to get row count without loading all data
-                    sheet_preview = pd.read_excel(file_path, sheet_name=sheet_name, nrows=5)
-                    if sheet_preview.empty:
-                        text_parts.append(f"Sheet: {sheet_name} (empty)")
-                        continue
-
-                    # For large files, use chunksize to read in batches
-                    if file_size_mb > 10:  # For files larger than 10MB
-                        # Read with nrows parameter to limit rows
-                        sheet_df = pd.read_excel(file_path, sheet_name=sheet_name, nrows=max_rows_per_sheet)
-                        total_rows = len(sheet_df)
-
-                        # Check if we might have truncated rows
-                        if total_rows >= max_rows_per_sheet:
-                            logging.info(f"Sheet {sheet_name} has at least {total_rows} rows, may be truncated")
-                            truncated = True
-                        else:
-                            truncated = False
-                    else:
-                        # For smaller files, read the whole sheet
-                        sheet_df = pd.read_excel(file_path, sheet_name=sheet_name)
-                        total_rows = len(sheet_df)
-
-                        # Check if we need to truncate
-                        if total_rows > max_rows_per_sheet:
-                            logging.info(f"Truncating sheet {sheet_name} from {total_rows} to {max_rows_per_sheet} rows")
-                            sheet_df = sheet_df.head(max_rows_per_sheet)
-                            truncated = True
+                    logging.info(f"Processing Excel sheet {sheet_index+1}/{sheets_to_process}: {sheet_name}")
+
+                    # Read the sheet with row limits for large files
+                    try:
+                        if not use_pandas:
+                            # Read-only openpyxl parses just the rows/columns we are going to show
+                            sheet_df, total_columns, truncated = _read_sheet_openpyxl(workbook[sheet_name], max_rows_per_sheet, 10)
+                            if sheet_df.empty:
+                                text_parts.append(f"Sheet: {sheet_name} (empty)")
+                                continue
+                            total_rows = f"{max_rows_per_sheet}+" if truncated else len(sheet_df)
+                            if truncated:
+                                logging.info(f"Sheet {sheet_name} has more than {max_rows_per_sheet} rows, truncated")
+                            column_names = [str(column) for column in sheet_df.columns]
+                            if total_columns > len(column_names):
+                                column_names.append(f"... ({total_columns} in total)")
                         else:
-                            truncated = False
+                            # The sheet is parsed once from the already opened ExcelFile (no separate preview read)
+                            if file_size_mb > 10:  # For files larger than 10MB
+                                # Read one row more than we show, so truncation is detected exactly
+                                sheet_df = excel_file.parse(sheet_name=sheet_name, nrows=max_rows_per_sheet + 1)
+                                truncated = len(sheet_df) > max_rows_per_sheet
+                                if truncated:
+                                    logging.info(f"Sheet {sheet_name} has more than {max_rows_per_sheet} rows, truncated")
+                                    sheet_df = sheet_df.head(max_rows_per_sheet)
+                                total_rows = len(sheet_df)
+                            else:
+                                # For smaller files, read the whole sheet
+                                sheet_df = excel_file.parse(sheet_name=sheet_name)
+                                total_rows = len(sheet_df)
+
+                                # Check if we need to truncate
+                                if total_rows > max_rows_per_sheet:
+                                    logging.info(f"Truncating sheet {sheet_name} from {total_rows} to {max_rows_per_sheet} rows")
+                                    sheet_df = sheet_df.head(max_rows_per_sheet)
+                                    truncated = True
+                                else:
+                                    truncated = False
 
-                    # Add sheet header
-                    text_parts.append(f"Sheet: {sheet_name} ({total_rows} rows, {len(sheet_df.columns)} columns)")
+                            if sheet_df.empty:
+                                text_parts.append(f"Sheet: {sheet_name} (empty)")
+                                continue
 
-                    # Add column names
-                    text_parts.append(f"Columns: {', '.join(sheet_df.columns)}")
+                            total_columns = len(sheet_df.columns)
+                            column_names = [str(column) for column in sheet_df.columns]
 
-                    # Format the data
-                    if not sheet_df.empty:
-                        # For very wide DataFrames, limit the output
-                        if len(sheet_df.columns) > 10:
-                            logging.info(f"Sheet {sheet_name} has {len(sheet_df.columns)} columns, showing first 10")
-                            text_parts.append("Note: Showing only first 10 columns due to width limits.")
-                            sheet_df = sheet_df.iloc[:, :10]
+                        # Add sheet header
+                        text_parts.append(f"Sheet: {sheet_name} ({total_rows} rows, {total_columns} columns)")
 
-                        # Convert to string and add to text parts
-                        text_parts.append(sheet_df.to_string())
+                        # Add column names
+                        text_parts.append(f"Columns: {', '.join(column_names)}")
 
-                        # Add truncation note if needed
-                        if truncated:
-                            text_parts.append(f"Note: Only showing first {max_rows_per_sheet} rows of this sheet.")
+                        # Format the data
+                        if not sheet_df.empty:
+                            # For very wide DataFrames, limit the output
+                            if total_columns > 10:
+                                logging.info(f"Sheet {sheet_name} has {total_columns} columns, showing first 10")
+                                text_parts.append("Note: Showing only first 10 columns due to width limits.")
+                                sheet_df = sheet_df.iloc[:, :10]
 
-                    text_parts.append("")  # Empty line for separation
+                            # Convert to string and add to text parts
+                            sheet_df.to_string(buf=text_parts.open_part())
 
-                except Exception as sheet_error:
-                    logging.error(f"Error reading sheet {sheet_name}: {sheet_error}")
-                    text_parts.append(f"Sheet: {sheet_name} (Error: {sheet_error})")
+                            # Add truncation note if needed
+                            if truncated:
+                                text_parts.append(f"Note: Only showing first {max_rows_per_sheet} rows of this sheet.")
 
-            except Exception as e:
-                logging.error(f"Error processing sheet {sheet_name}: {e}")
-                text_parts.append(f"Error processing sheet {sheet_name}: {e}")
+                        text_parts.append("")  # Empty line for separation
+
+                    except Exception as sheet_error:
+                        logging.error(f"Error reading sheet {sheet_name}: {sheet_error}")
+                        _mark_parse_uncacheable()
+                        text_parts.append(f"Sheet: {sheet_name} (Error: {sheet_error})")
+
+                except Exception as e:
+                    logging.error(f"Error processing sheet {sheet_name}: {e}")
+                    _mark_parse_uncacheable()
+                    text_parts.append(f"Error processing sheet {sheet_name}: {e}")
+        finally:
+            if use_pandas:
+                excel_file.close()
+            else:
+                workbook.close()
 
         # Join all parts with newlines
-        result = "\n".join(text_parts)
+        result = text_parts.getvalue()
 
         logging.info(f"Successfully parsed Excel file: {os.path.basename(file_path)}")
         return result
@@ -605,6 +1344,88 @@ def parse_xlsx_file(file_path, max_rows_per_sheet=1000, max_sheets=None):
         logging.error(f"Error parsing Excel file {file_path}: {e}")
         raise
 
+CSV_SNIFF_BYTES = 65536  # Velikost vzorku pro detekci kódování a oddělovače
+CSV_PREVIEW_ROWS = 50
+
+def _sniff_csv_format(file_path):
+    """
+    Detects encoding and delimiter of a CSV file from a single sample read.
+
+    Returns a tuple (encoding, delimiter).
+    """
+    with open(file_path, 'rb') as f:
+        sample = f.read(CSV_SNIFF_BYTES)
+
+    try:
+        # Incremental decoder tolerates a multi-byte character cut at the end of the sample
+        text = codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        encoding = 'utf-8'
+    except UnicodeDecodeError:
+        encoding = 'latin1'
+        text = sample.decode(encoding)
+
+    try:
+        delimiter = csv.Sniffer().sniff(text, delimiters=',;\t|').delimiter
+    except csv.Error:
+        delimiter = ','
+    return encoding, delimiter
+
+def _read_csv_with_retries(file_path):
+    """Reads a CSV with pandas, trying several encodings and delimiters (slow fallback path)."""
+    # List of encodings to try
+    encodings = ['utf-8', 'latin1', 'iso-8859-1', 'cp1252']
+
+    # Try to detect encoding and delimiter
+    df = None
+    last_error = None
+
+    # First try: Use pandas with default settings
+    for encoding in encodings:
+        try:
+            df = pd.read_csv(file_path, encoding=encoding)
+            logging.info(f"Successfully parsed CSV with {encoding} encoding")
+            break
+        except UnicodeDecodeError:
+            continue
+        except pd.errors.ParserError:
+            # If parsing fails, it might be due to delimiter
+            try:
+                # Try to detect delimiter by reading first few lines
+                with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
+                    sample = f.read(1024)
+                    try:
+                        dialect = csv.Sniffer().sniff(sample)
+                        df = pd.read_csv(file_path, sep=dialect.delimiter, encoding=encoding)
+                        logging.info(f"Successfully parsed CSV with {encoding} encoding and {dialect.delimiter} delimiter")
+                        break
+                    except csv.Error:
+                        # Sniffer failed, try common delimiters
+                        for delimiter in [',', ';', '\t', '|']:
+                            try:
+                                df = pd.read_csv(file_path, sep=delimiter, encoding=encoding)
+                                logging.info(f"Successfully parsed CSV with {encoding} encoding and {delimiter} delimiter")
+                                break
+                            except:
+                                continue
+                        if df is not None:
+                            break
+            except Exception as e:
+                last_error = e
+                continue
+        except Exception as e:
+            last_error = e
+            continue
+
+    # If all attempts failed
+    if df is None:
+        if last_error:
+            raise ValueError(f"Failed to parse CSV file: {last_error}")
+        else:
+            raise ValueError("Failed to parse CSV file: Unknown error")
+
+    return df
+
+@cached_parse("2")
 def parse_csv_file(file_path):
     """
     Parses CSV files using pandas.
@@ -632,82 +1453,71 @@ def parse_csv_file(file_path):
             logging.warning(f"CSV file {os.path.basename(file_path)} is empty")
             return "Empty CSV file"
 
-        # List of encodings to try
-        encodings = ['utf-8', 'latin1', 'iso-8859-1', 'cp1252']
-
-        # Try to detect encoding and delimiter
+        # Single sniff pass for encoding and delimiter, then one read of the whole file
+        encoding, delimiter = _sniff_csv_format(file_path)
         df = None
-        last_error = None
-
-        # First try: Use pandas with default settings
-        for encoding in encodings:
-            try:
-                df = pd.read_csv(file_path, encoding=encoding)
-                logging.info(f"Successfully parsed CSV with {encoding} encoding")
-                break
-            except UnicodeDecodeError:
-                continue
-            except pd.errors.ParserError:
-                # If parsing fails, it might be due to delimiter
-                try:
-                    # Try to detect delimiter by reading first few lines
-                    with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
-                        sample = f.read(1024)
-                        try:
-                            dialect = csv.Sniffer().sniff(sample)
-                            df = pd.read_csv(file_path, sep=dialect.delimiter, encoding=encoding)
-                            logging.info(f"Successfully parsed CSV with {encoding} encoding and {dialect.delimiter} delimiter")
-                            break
-                        except csv.Error:
-                            # Sniffer failed, try common delimiters
-                            for delimiter in [',', ';', '\t', '|']:
-                                try:
-                                    df = pd.read_csv(file_path, sep=delimiter, encoding=encoding)
-                                    logging.info(f"Successfully parsed CSV with {encoding} encoding and {delimiter} delimiter")
-                                    break
-                                except:
-                                    continue
-                            if df is not None:
-                                break
-                except Exception as e:
-                    last_error = e
-                    continue
-            except Exception as e:
-                last_error = e
-                continue
-
-        # If all attempts failed
-        if df is None:
-            if last_error:
-                raise ValueError(f"Failed to parse CSV file: {last_error}")
+        table = None
+        try:
+            if PYARROW_AVAILABLE:
+                table = pa_csv.read_csv(
+                    file_path,
+                    read_options=pa_csv.ReadOptions(encoding=encoding, block_size=1 << 20),
+                    parse_options=pa_csv.ParseOptions(delimiter=delimiter)
+                )
+            else:
+                df = pd.read_csv(file_path, sep=delimiter, encoding=encoding)
+            logging.info(f"Successfully parsed CSV with {encoding} encoding and {delimiter!r} delimiter")
+        except Exception as read_error:
+            logging.info(f"Single-pass CSV read failed ({read_error}), trying other encodings and delimiters")
+            df = _read_csv_with_retries(file_path)
+
+        if table is not None:
+            # Only the previewed rows are converted to pandas
+            row_count = table.num_rows
+            column_names = table.column_names
+            if row_count > 2 * CSV_PREVIEW_ROWS:
+                head_df = table.slice(0, CSV_PREVIEW_ROWS).to_pandas()
+                tail_df = table.slice(row_count - CSV_PREVIEW_ROWS).to_pandas()
+                tail_df.index = range(row_count - CSV_PREVIEW_ROWS, row_count)
             else:
-                raise ValueError("Failed to parse CSV file: Unknown error")
+                head_df = table.to_pandas()
+                tail_df = None
+        else:
+            row_count = len(df)
+            column_names = list(df.columns)
+            if row_count > 2 * CSV_PREVIEW_ROWS:
+                head_df = df.head(CSV_PREVIEW_ROWS)
+                tail_df = df.tail(CSV_PREVIEW_ROWS)
+            else:
+                head_df = df
+                tail_df = None
 
         # Check if DataFrame is empty
-        if df.empty:
+        if row_count == 0:
             logging.warning(f"CSV file {os.path.basename(file_path)} appears to be empty or has no valid data")
             return "CSV file contains no valid data"
 
         # Convert DataFrame to string representation
-        text = "CSV File Content:\n\n"
+        text = io.StringIO()
+        text.write("CSV File Content:\n\n")
 
         # Add metadata about the file
-        text += f"Rows: {len(df)}, Columns: {len(df.columns)}\n"
-        text += f"Column names: {', '.join(df.columns)}\n\n"
+        text.write(f"Rows: {row_count}, Columns: {len(column_names)}\n")
+        text.write(f"Column names: {', '.join(str(name) for name in column_names)}\n\n")
 
         # For very large DataFrames, limit the output
-        if len(df) > 100:
-            text += "Note: Showing first 50 and last 50 rows of a large CSV file.\n\n"
-            text += "First 50 rows:\n"
-            text += df.head(50).to_string()
-            text += "\n\n...\n\n"
-            text += "Last 50 rows:\n"
-            text += df.tail(50).to_string()
+        if tail_df is not None:
+            text.write("Note: Showing first 50 and last 50 rows of a large CSV file.\n\n")
+            text.write("First 50 rows:\n")
+            head_df.to_string(buf=text)
+            text.write("\n\n...\n\n")
+            text.write("Last 50 rows:\n")
+            tail_df.to_string(buf=text)
         else:
-            text += df.to_string()
+            head_df.to_string(buf=text)
 
         logging.info(f"Successfully parsed CSV file: {os.path.basename(file_path)}")
-        return text
+        return text.getvalue()
     except pd.errors.EmptyDataError:
         logging.warning(f"CSV file {os.path.basename(file_path)} is empty or has no columns")
         return "CSV file is empty or has no columns"
@@ -724,6 +1534,84 @@ def parse_csv_file(file_path):
         logging.error(f"Error parsing CSV file {file_path}: {e}")
         raise
 
+def _load_json_file(file_path):
+    """
+    Loads a JSON file with orjson straight from the UTF-8 bytes.
+
+    Anything orjson rejects (other encodings, NaN, integers beyond 64 bits, invalid JSON) is
+    re-parsed by the json module, which also reports the line and column of real syntax errors.
+    """
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass
+    try:
+        return json.loads(raw.decode('utf-8'))
+    except UnicodeDecodeError:
+        # Try with different encoding if UTF-8 fails
+        return json.loads(raw.decode('latin1'))
+
+JSON_STREAM_MIN_BYTES = 2 * 1024 * 1024  # Větší pole procházíme proudově přes ijson místo načtení celého souboru
+JSON_ARRAY_HEAD_ITEMS = 100  # Začátek pole, který si z něj ponecháme pro výpis
+JSON_ARRAY_TAIL_ITEMS = 50  # Konec pole, který si z něj ponecháme pro výpis
+
+def _summarize_json_array(items):
+    """
+    Collects what parse_json_file prints about a JSON array in a single pass over its items.
+
+    Returns a tuple (item_count, head, tail, uniform): the first JSON_ARRAY_HEAD_ITEMS and last
+    JSON_ARRAY_TAIL_ITEMS items, and whether all items are objects with the first object's keys
+    (True/False, or None when a non-object item comes before any differing object).
+    """
+    head = []
+    tail = deque(maxlen=JSON_ARRAY_TAIL_ITEMS)
+    item_count = 0
+    first_keys = None
+    uniform = True
+    for item in items:
+        if item_count < JSON_ARRAY_HEAD_ITEMS:
+            head.append(item)
+        tail.append(item)
+        if item_count == 0:
+            first_keys = set(item.keys()) if isinstance(item, dict) else None
+        elif first_keys is not None and uniform:
+            if not isinstance(item, dict):
+                uniform = None
+            elif set(item.keys()) != first_keys:
+                uniform = False
+        item_count += 1
+    return item_count, head, list(tail), uniform
+
+def _stream_json_array(file_path):
+    """
+    Summarizes a top-level JSON array with ijson without materializing the whole document.
+
+    Returns the _summarize_json_array tuple, or None if the root is not an array or ijson cannot
+    read the file (the caller then loads it in full, which also reports syntax errors properly).
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            _, first_event, _ = next(ijson.parse(f))
+            if first_event != 'start_array':
+                return None
+            f.seek(0)
+            return _summarize_json_array(ijson.items(f, 'item', use_float=True))
+    except (ijson.JSONError, UnicodeDecodeError, StopIteration) as stream_error:
+        logging.warning(f"Streaming JSON parse failed for {os.path.basename(file_path)}, loading it in full: {stream_error}")
+        return None
+
+def _dump_json(data):
+    """Pretty-prints JSON data with 2-space indentation (orjson if installed, otherwise the json module)."""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode('utf-8')
+        except orjson.JSONEncodeError:
+            pass  # E.g. integers beyond 64 bits or very deep nesting
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
 def parse_json_file(file_path):
     """
     Parses JSON files.
@@ -751,84 +1639,73 @@ def parse_json_file(file_path):
             logging.warning(f"JSON file {os.path.basename(file_path)} is empty")
             return "Empty JSON file"
 
-        # Try to load the JSON file
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except UnicodeDecodeError:
-            # Try with different encoding if UTF-8 fails
-            with open(file_path, 'r', encoding='latin1') as f:
-                data = json.load(f)
+        # Large arrays are scanned as a stream; everything else is loaded in full
+        array_summary = None
+        if IJSON_AVAILABLE and os.path.getsize(file_path) > JSON_STREAM_MIN_BYTES:
+            array_summary = _stream_json_array(file_path)
+        if array_summary is None:
+            data = _load_json_file(file_path)
+            if isinstance(data, list):
+                array_summary = _summarize_json_array(data)
 
         # Check if data is None or empty
-        if data is None:
+        if array_summary is not None:
+            if not array_summary[0]:
+                logging.warning(f"JSON file {os.path.basename(file_path)} contains empty array []")
+                return "JSON file contains empty array []"
+        elif data is None:
             logging.warning(f"JSON file {os.path.basename(file_path)} contains null value")
             return "JSON file contains null value"
         elif isinstance(data, dict) and not data:
             logging.warning(f"JSON file {os.path.basename(file_path)} contains empty object {{}}")
             return "JSON file contains empty object {}"
-        elif isinstance(data, list) and not data:
-            logging.warning(f"JSON file {os.path.basename(file_path)} contains empty array []")
-            return "JSON file contains empty array []"
 
         # Format JSON data for readability
-        if isinstance(data, list):
-            text = f"JSON File Content (Array with {len(data)} items):\n\n"
+        if array_summary is not None:
+            item_count, head, tail, uniform = array_summary
+            text = f"JSON File Content (Array with {item_count} items):\n\n"
+
+            # The output format is decided once: a table for objects with the same structure,
+            # pretty-printed JSON otherwise (the DataFrame is never built for non-uniform arrays)
+            if isinstance(head[0], dict) and uniform:
+                # For very large arrays, limit the output (the DataFrame only holds the printed rows)
+                if item_count > 100:
+                    df = pd.DataFrame.from_records(itertools.chain(head[:50], tail),
+                                                   index=[*range(50), *range(item_count - 50, item_count)])
+                    text += "Note: Showing first 50 and last 50 rows of a large JSON array.\n\n"
+                    text += "First 50 rows:\n"
+                    text += df.head(50).to_string()
+                    text += "\n\n...\n\n"
+                    text += "Last 50 rows:\n"
+                    text += df.tail(50).to_string()
+                else:
+                    text += pd.DataFrame.from_records(head).to_string()
+            elif isinstance(head[0], dict):
+                if uniform is False:
+                    # If objects have different structures, fall back to pretty-printed JSON
+                    text += "Note: Array contains objects with different structures.\n\n"
+                elif item_count > 20:
+                    # Objects mixed with other values
+                    text += "Note: Showing first 10 and last 10 items of a large JSON array.\n\n"
 
-            # If it's a list of objects, try to convert to a DataFrame for better formatting
-            if data and isinstance(data[0], dict):
-                try:
-                    # Check if all objects have the same structure
-                    keys = set(data[0].keys())
-                    uniform_structure = all(set(item.keys()) == keys for item in data)
-
-                    if uniform_structure:
-                        df = pd.DataFrame(data)
-
-                        # For very large DataFrames, limit the output
-                        if len(df) > 100:
-                            text += "Note: Showing first 50 and last 50 rows of a large JSON array.\n\n"
-                            text += "First 50 rows:\n"
-                            text += df.head(50).to_string()
-                            text += "\n\n...\n\n"
-                            text += "Last 50 rows:\n"
-                            text += df.tail(50).to_string()
-                        else:
-                            text += df.to_string()
-                    else:
-                        # If objects have different structures, fall back to pretty-printed JSON
-                        text += "Note: Array contains objects with different structures.\n\n"
-
-                        # For very large arrays, limit the output
-                        if len(data) > 20:
-                            text += json.dumps(data[:10], indent=2)
-                            text += "\n\n... (truncated) ...\n\n"
-                            text += json.dumps(data[-10:], indent=2)
-                        else:
-                            text += json.dumps(data, indent=2)
-                except Exception as df_error:
-                    logging.warning(f"Failed to convert JSON array to DataFrame: {df_error}")
-                    # Fall back to pretty-printed JSON
-
-                    # For very large arrays, limit the output
-                    if len(data) > 20:
-                        text += "Note: Showing first 10 and last 10 items of a large JSON array.\n\n"
-                        text += json.dumps(data[:10], indent=2)
-                        text += "\n\n... (truncated) ...\n\n"
-                        text += json.dumps(data[-10:], indent=2)
-                    else:
-                        text += json.dumps(data, indent=2)
+                # For very large arrays, limit the output
+                if item_count > 20:
+                    text += _dump_json(head[:10])
+                    text += "\n\n... (truncated) ...\n\n"
+                    text += _dump_json(tail[-10:])
+                else:
+                    text += _dump_json(head)
             else:
                 # Just pretty-print the JSON array
 
                 # For very large arrays, limit the output
-                if len(data) > 100:
+                if item_count > 100:
                     text += "Note: Showing first 50 and last 50 items of a large JSON array.\n\n"
-                    text += json.dumps(data[:50], indent=2)
+                    text += _dump_json(head[:50])
                     text += "\n\n... (truncated) ...\n\n"
-                    text += json.dumps(data[-50:], indent=2)
+                    text += _dump_json(tail)
                 else:
-                    text += json.dumps(data, indent=2)
+                    text += _dump_json(head)
         else:
             # For objects/dictionaries
             text = "JSON File Content (Object):\n\n"
@@ -841,7 +1718,7 @@ def parse_json_file(file_path):
                 text += f"Object with {num_keys} top-level keys: {', '.join(data.keys())}\n\n"
 
             # Pretty-print the JSON object
-            text += json.dumps(data, indent=2)
+            text += _dump_json(data)
 
         logging.info(f"Successfully parsed JSON file: {os.path.basename(file_path)}")
         return text
@@ -859,9 +1736,127 @@ def parse_json_file(file_path):
         logging.error(f"Error parsing JSON file {file_path}: {e}")
         raise
 
+HTML_NON_CONTENT_TAGS = ('script', 'style', 'head', 'title', 'meta', 'link', 'noscript', 'iframe', 'svg')
+HTML_CHARSET_SNIFF_BYTES = 4096  # V jaké části začátku souboru hledáme deklaraci kódování
+HTML_CHARSET_DECLARATION_RE = re.compile(rb'<meta[^>]*charset|<\?xml[^>]*encoding', re.IGNORECASE)
+
+# XPath výrazy kompilujeme jednou při importu, ne při každém volání
+HTML_TITLE_XPATH = lxml.etree.XPath('//title')
+HTML_META_XPATHS = {meta_name: lxml.etree.XPath(f"//meta[@name='{meta_name}']") for meta_name in ('description', 'keywords')}
+HTML_HEADINGS_XPATH = lxml.etree.XPath('//h1|//h2|//h3')
+
+@functools.lru_cache(maxsize=None)
+def _soup_strainer(name, meta_name=None):
+    """Returns a shared SoupStrainer for the BeautifulSoup fallback (a tag name or tuple of names, optionally a meta name)."""
+    return SoupStrainer(list(name) if isinstance(name, tuple) else name,
+                        attrs={'name': meta_name} if meta_name else {})
+
+def _html_fallback_encoding(raw):
+    """
+    Returns the encoding lxml should assume for undeclared HTML bytes, or None to let it detect one.
+
+    libxml2 honors a BOM, <meta charset> and the XML declaration itself, but reads undeclared
+    bytes as latin1; undeclared non-ASCII content is therefore taken as UTF-8 when it decodes as such.
+    """
+    if raw.startswith((codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)) or raw.isascii():
+        return None
+    if HTML_CHARSET_DECLARATION_RE.search(raw, 0, HTML_CHARSET_SNIFF_BYTES):
+        return None
+    try:
+        raw.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin1'
+
+def _extract_html_lxml(raw):
+    """
+    Extracts (title, metadata, headings, text) from HTML bytes with lxml.html directly.
+
+    Non-content elements are dropped with lxml.etree.strip_elements (their tail text is kept)
+    and the remaining text nodes are joined by newlines, like BeautifulSoup's get_text(separator='\n').
+    """
+    encoding = _html_fallback_encoding(raw)
+    parser = lxml.html.HTMLParser(encoding=encoding) if encoding else None
+    tree = lxml.html.document_fromstring(raw, parser=parser)
+    metadata = {}
+
+    # Extract title
+    title_elements = HTML_TITLE_XPATH(tree)
+    title = title_elements[0].text_content() if title_elements else "No title"
+    metadata["title"] = title
+
+    # Extract meta description and keywords if available
+    for meta_name, meta_xpath in HTML_META_XPATHS.items():
+        meta_elements = meta_xpath(tree)
+        if meta_elements and meta_elements[0].get('content') is not None:
+            metadata[meta_name] = meta_elements[0].get('content')
+
+    # Extract headings for structure overview
+    headings = []
+    for h in HTML_HEADINGS_XPATH(tree):
+        heading_text = h.text_content().strip()
+        if heading_text:
+            headings.append(f"{h.tag}: {heading_text}")
+
+    # Extract text content (remove script, style, and other non-content elements)
+    lxml.etree.strip_elements(tree, *HTML_NON_CONTENT_TAGS, with_tail=False)
+    text = '\n'.join(tree.itertext())
+    return title, metadata, headings, text
+
+def _soup_content_strings(soup):
+    """
+    Yields the text strings of a BeautifulSoup tree in document order, skipping non-content subtrees.
+
+    Equivalent to extract()-ing every HTML_NON_CONTENT_TAGS element and calling get_text(), but
+    walks the tree once and jumps over the skipped subtrees instead of detaching them one by one.
+    """
+    element = next(soup.descendants, None)
+    while element is not None:
+        if isinstance(element, Tag):
+            if element.name in HTML_NON_CONTENT_TAGS:
+                # Jump to whatever follows the skipped subtree
+                while element is not None and element.next_sibling is None:
+                    element = element.parent
+                element = element.next_sibling if element is not None else None
+                continue
+        elif element.__class__ in (NavigableString, CData):
+            yield element
+        element = element.next_element
+
+def _extract_html_soup(raw):
+    """Extracts (title, metadata, headings, text) from HTML bytes with BeautifulSoup's html.parser (which detects the encoding)."""
+    soup = BeautifulSoup(raw, 'html.parser')
+
+    # Extract metadata
+    metadata = {}
+
+    # Extract title
+    title = soup.title.string if soup.title else "No title"
+    metadata["title"] = title
+
+    # Extract meta description if available
+    meta_desc = soup.find(_soup_strainer('meta', 'description'))
+    if meta_desc and 'content' in meta_desc.attrs:
+        metadata["description"] = meta_desc['content']
+
+    # Extract meta keywords if available
+    meta_keywords = soup.find(_soup_strainer('meta', 'keywords'))
+    if meta_keywords and 'content' in meta_keywords.attrs:
+        metadata["keywords"] = meta_keywords['content']
+
+    # Extract headings for structure overview
+    headings = []
+    for h in soup.find_all(_soup_strainer(('h1', 'h2', 'h3'))):
+        if h.text.strip():
+            headings.append(f"{h.name}: {h.text.strip()}")
+
+    # Extract text content (skip script, style, and other non-content elements)
+    text = '\n'.join(_soup_content_strings(soup))
+    return title, metadata, headings, text
+
 def parse_html_file(file_path):
     """
-    Parses HTML files using BeautifulSoup.
+    Parses HTML files using lxml (BeautifulSoup's html.parser as a fallback).
 
     Extracts text content from HTML files, removing scripts, styles, and other non-content elements.
     Also extracts the document title if available.
@@ -886,58 +1881,24 @@ def parse_html_file(file_path):
             logging.warning(f"HTML file {os.path.basename(file_path)} is empty")
             return "Empty HTML file"
 
-        # Try to read the file with different encodings if needed
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-        except UnicodeDecodeError:
-            # Try with different encoding if UTF-8 fails
-            with open(file_path, 'r', encoding='latin1', errors='replace') as f:
-                html_content = f.read()
-                logging.info(f"Used latin1 encoding for HTML file: {os.path.basename(file_path)}")
+        # Read raw bytes - the parser detects the encoding (BOM, <meta charset>) itself
+        with open(file_path, 'rb') as f:
+            raw = f.read()
 
         # Check if content is too small to be valid HTML
-        if len(html_content) < 10:  # Arbitrary small size
+        if len(raw) < 10:  # Arbitrary small size
             logging.warning(f"HTML file {os.path.basename(file_path)} contains minimal content")
-            return f"HTML file contains minimal content: {html_content}"
+            return f"HTML file contains minimal content: {raw.decode('utf-8', errors='replace')}"
 
-        # Parse HTML with BeautifulSoup
+        # Parse HTML with lxml
         try:
-            soup = BeautifulSoup(html_content, 'lxml')
+            title, metadata, headings, text = _extract_html_lxml(raw)
         except Exception as parser_error:
             # Fall back to html.parser if lxml fails
             logging.warning(f"lxml parser failed, falling back to html.parser: {parser_error}")
-            soup = BeautifulSoup(html_content, 'html.parser')
-
-        # Extract metadata
-        metadata = {}
-
-        # Extract title
-        title = soup.title.string if soup.title else "No title"
-        metadata["title"] = title
-
-        # Extract meta description if available
-        meta_desc = soup.find('meta', attrs={'name': 'description'})
-        if meta_desc and 'content' in meta_desc.attrs:
-            metadata["description"] = meta_desc['content']
-
-        # Extract meta keywords if available
-        meta_keywords = soup.find('meta', attrs={'name': 'keywords'})
-        if meta_keywords and 'content' in meta_keywords.attrs:
-            metadata["keywords"] = meta_keywords['content']
+            title, metadata, headings, text = _extract_html_soup(raw)
 
-        # Extract headings for structure overview
-        headings = []
-        for h in soup.find_all(['h1', 'h2', 'h3']):
-            if h.text.strip():
-                headings.append(f"{h.name}: {h.text.strip()}")
-
-        # Extract text content (remove script, style, and other non-content elements)
-        for element in soup(['script', 'style', 'head', 'title', 'meta', 'link', 'noscript', 'iframe', 'svg']):
-            element.extract()
-
-        # Get text and clean up whitespace
-        text = soup.get_text(separator='\n')
+        # Clean up whitespace
         lines = [line.strip() for line in text.splitlines() if line.strip()]
         text = '\n'.join(lines)
 
@@ -995,9 +1956,70 @@ def parse_html_file(file_path):
         logging.error(f"Error parsing HTML file {file_path}: {e}")
         raise
 
+ODF_TEXT_P = '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}p'
+ODF_OFFICE_META = '{urn:oasis:names:tc:opendocument:xmlns:office:1.0}meta'
+ODF_META_FIELDS = {
+    # Klíč v metadatech -> element v meta.xml
+    "title": '{http://purl.org/dc/elements/1.1/}title',
+    "creator": '{http://purl.org/dc/elements/1.1/}creator',
+    "date": '{urn:oasis:names:tc:opendocument:xmlns:meta:1.0}creation-date',
+}
+
+def _read_odt_metadata(odt_zip):
+    """Reads title, creator and creation date from meta.xml of an opened ODT archive (missing fields are left out)."""
+    metadata = {}
+    if 'meta.xml' not in odt_zip.namelist():
+        return metadata
+    with odt_zip.open('meta.xml') as meta_xml:
+        office_meta = lxml.etree.parse(meta_xml).getroot().find(ODF_OFFICE_META)
+    if office_meta is None:
+        return metadata
+    for key, tag in ODF_META_FIELDS.items():
+        element = office_meta.find(tag)
+        if element is not None and element.text:
+            metadata[key] = element.text
+    return metadata
+
+def _odt_paragraph_text(paragraph):
+    """Returns the text of a text:p element: its own text and the text directly inside its child elements (spans etc.)."""
+    parts = [paragraph.text or ""]
+    for child in paragraph:
+        parts.append(child.text or "")
+        parts.extend(grandchild.tail or "" for grandchild in child)
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+def _iter_odt_paragraphs(odt_zip):
+    """
+    Yields the text of every text:p in content.xml in document order, parsing it with lxml.etree.iterparse.
+
+    Elements are cleared as soon as they are processed, so memory stays flat regardless of document size.
+    Paragraphs nested in another paragraph (e.g. in notes) follow their enclosing paragraph.
+    """
+    open_paragraphs = []  # One list of finished nested paragraph texts per currently open text:p
+    with odt_zip.open('content.xml') as content_xml:
+        for event, element in lxml.etree.iterparse(content_xml, events=('start', 'end')):
+            if element.tag == ODF_TEXT_P:
+                if event == 'start':
+                    open_paragraphs.append([])
+                    continue
+                texts = [_odt_paragraph_text(element)] + open_paragraphs.pop()
+                if open_paragraphs:
+                    open_paragraphs[-1].extend(texts)
+                    continue
+                yield from texts
+            elif event == 'start' or open_paragraphs:
+                continue
+            # Nothing inside an open paragraph needs this element any more
+            element.clear(keep_tail=True)
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
 def parse_odt_file(file_path):
     """
-    Parses ODT (OpenDocument Text) files using odfpy.
+    Parses ODT (OpenDocument Text) files by streaming content.xml from the ZIP archive with lxml.
 
     Extracts text content from ODT files, preserving paragraph structure.
 
@@ -1026,89 +2048,66 @@ def parse_odt_file(file_path):
             return "File is too small to be a valid ODT document"
 
         try:
-            # Load the ODT document
-            doc = odf.opendocument.load(file_path)
-        except Exception as load_error:
+            # Open the ODT archive
+            odt_zip = zipfile.ZipFile(file_path)
+        except zipfile.BadZipFile as load_error:
             logging.error(f"Failed to load ODT file {file_path}: {load_error}")
             raise ValueError(f"Invalid ODT format: {load_error}")
 
-        # Extract metadata if available
-        metadata = {}
-
-        # Try to get document title
-        try:
-            metadata["title"] = doc.meta.getChildByName("title").firstChild.data
-        except:
-            metadata["title"] = "Untitled"
-
-        # Try to get document creator
-        try:
-            metadata["creator"] = doc.meta.getChildByName("creator").firstChild.data
-        except:
-            pass
-
-        # Try to get document creation date
-        try:
-            metadata["date"] = doc.meta.getChildByName("creation-date").firstChild.data
-        except:
-            pass
-
-        # Extract all paragraphs
-        paragraphs = doc.getElementsByType(P)
+        with odt_zip:
+            try:
+                # Extract metadata if available
+                metadata = _read_odt_metadata(odt_zip)
+                metadata.setdefault("title", "Untitled")
+
+                # Format the output
+                header = ""
+
+                # Add metadata if available
+                if metadata["title"] != "Untitled":
+                    header += f"Title: {metadata['title']}\n"
+                if "creator" in metadata:
+                    header += f"Author: {metadata['creator']}\n"
+                if "date" in metadata:
+                    header += f"Created: {metadata['date']}\n"
+                if header:
+                    header += "\n"
+
+                # Stream paragraphs into a head/tail buffer - for very large content only the first 5000
+                # and last 2000 characters are kept
+                result = HeadTailBuffer(max_chars=10000, head_chars=5000, tail_chars=2000)
+                result.write(header)
+                paragraph_count = 0
+                has_text = False
+                for para_text in _iter_odt_paragraphs(odt_zip):
+                    paragraph_count += 1
+                    if para_text:
+                        result.write(para_text + "\n")
+                        has_text = has_text or not para_text.isspace()
+            except (KeyError, lxml.etree.XMLSyntaxError) as load_error:
+                # KeyError: content.xml missing from the archive
+                logging.error(f"Failed to load ODT file {file_path}: {load_error}")
+                raise ValueError(f"Invalid ODT format: {load_error}")
 
         # Check if document has any paragraphs
-        if not paragraphs:
+        if not paragraph_count:
             logging.warning(f"ODT file {os.path.basename(file_path)} contains no paragraphs")
             return "ODT document contains no text content"
 
-        # Combine text from all paragraphs
-        text = ""
-        for paragraph in paragraphs:
-            # Get the text content of the paragraph by iterating through its children
-            para_text = ""
-            for node in paragraph.childNodes:
-                if node.nodeType == node.TEXT_NODE:
-                    para_text += node.data
-                elif hasattr(node, 'childNodes'):
-                    # Handle spans and other elements with text
-                    for child in node.childNodes:
-                        if child.nodeType == child.TEXT_NODE:
-                            para_text += child.data
-
-            if para_text:
-                text += para_text + "\n"
-
         # Check if we extracted any meaningful content
-        if not text.strip():
+        if not has_text:
             logging.warning(f"No text content extracted from ODT file: {os.path.basename(file_path)}")
             return "ODT document contains no extractable text content"
 
-        # Format the output
-        result = ""
-
-        # Add metadata if available
-        if metadata:
-            if "title" in metadata and metadata["title"] != "Untitled":
-                result += f"Title: {metadata['title']}\n"
-            if "creator" in metadata:
-                result += f"Author: {metadata['creator']}\n"
-            if "date" in metadata:
-                result += f"Created: {metadata['date']}\n"
-            if result:
-                result += "\n"
-
-        # Add the main content
-        result += text
-
         # For very large content, limit the output
-        if len(result) > 10000:
+        if result.is_truncated():
             # Show first 5000 and last 2000 characters
-            truncated = result[:5000] + "\n\n... (content truncated) ...\n\n" + result[-2000:]
+            truncated = result.head() + "\n\n... (content truncated) ...\n\n" + result.tail()
             logging.info(f"Truncated large ODT content for {os.path.basename(file_path)}")
             return truncated
 
         logging.info(f"Successfully parsed ODT file: {os.path.basename(file_path)}")
-        return result
+        return result.getvalue()
     except IOError as e:
         logging.error(f"IO error reading ODT file {file_path}: {e}")
         raise IOError(f"Error reading file: {e}")
@@ -1122,6 +2121,43 @@ def parse_odt_file(file_path):
 
 # --- AI Processing Functions ---
 
+AI_MAX_CONCURRENT_REQUESTS = 8  # Kolik souborů process_files zpracovává souběžně (souběžné požadavky na Gemini API)
+
+@functools.lru_cache(maxsize=4)
+def _get_gemini_model(model_name):
+    """Returns a shared GenerativeModel per model name, created once per process instead of on every AI call."""
+    return genai.GenerativeModel(model_name)
+
+# --- AI Output Cache ---
+# Successful Gemini responses are cached on disk next to the parse cache, keyed by a BLAKE2b hash of the
+# model name, the prompt and the generation parameters. Bump AI_PROMPT_VERSION whenever a prompt changes.
+AI_CACHE_ENABLED = os.environ.get("CONVERTOR_AI_CACHE", "1") != "0"
+AI_CACHE_DIR = os.path.join(PARSE_CACHE_DIR, "ai")
+AI_PROMPT_VERSION = "1"
+
+def _ai_cache_path(model_name, *request_parts):
+    """Returns the cache file path for an AI request, or None if the AI output cache is disabled."""
+    if not AI_CACHE_ENABLED:
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (AI_PROMPT_VERSION, model_name, *request_parts):
+        digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return os.path.join(AI_CACHE_DIR, digest.hexdigest() + PARSE_CACHE_SUFFIX)
+
+def _get_cached_ai_output(cache_path, task):
+    """Returns a cached AI output for cache_path (None on a miss or with the cache disabled)."""
+    if cache_path is None:
+        return None
+    text = _read_cache_file(cache_path)
+    if text is not None:
+        logging.info(f"Using cached Gemini output for {task}")
+    return text
+
+def _store_ai_output(cache_path, text):
+    if cache_path is not None:
+        _write_cache_file(cache_path, text)
+
 def get_ai_table_processing(content, file_extension, model_name="gemini-1.5-flash-latest"):
     """
     Processes tabular data (Excel, CSV) using Gemini API and returns a structured table format.
@@ -1140,7 +2176,7 @@ def get_ai_table_processing(content, file_extension, model_name="gemini-1.5-flas
 
     try:
         # Use gemini-1.5-flash-latest model
-        model = genai.GenerativeModel(model_name)
+        model = _get_gemini_model(model_name)
 
         # Create a detailed prompt for tabular data processing
         prompt = f"""Zpracuj následující tabulková data s maximální přesností (95%+).
@@ -1176,6 +2212,11 @@ def get_ai_table_processing(content, file_extension, model_name="gemini-1.5-flas
             "max_output_tokens": 8192,
         }
 
+        cache_path = _ai_cache_path(model_name, prompt, generation_config)
+        cached_output = _get_cached_ai_output(cache_path, "tabular data processing")
+        if cached_output is not None:
+            return cached_output
+
         logging.info(f"Sending request to Gemini API for tabular data processing")
         response = model.generate_content(prompt, generation_config=generation_config)
 
@@ -1184,6 +2225,7 @@ def get_ai_table_processing(content, file_extension, model_name="gemini-1.5-flas
             return "[AI did not provide any processed tabular data]"
 
         logging.info(f"Successfully processed tabular data")
+        _store_ai_output(cache_path, response.text)
         return response.text
     except Exception as e:
         logging.error(f"Error calling Gemini API for tabular data ({model_name}): {e}")
@@ -1200,7 +2242,7 @@ def get_ai_image_description(file_path, model_name="gemini-1.5-flash-latest"):
         img = Image.open(file_path)
 
         # Use gemini-1.5-flash-latest which supports multimodal input
-        model = genai.GenerativeModel(model_name)
+        model = _get_gemini_model(model_name)
 
         # Prepare prompt with image and detailed instruction for high accuracy
         prompt_parts = [
@@ -1212,6 +2254,12 @@ def get_ai_image_description(file_path, model_name="gemini-1.5-flash-latest"):
             Tvůj popis by měl být vyčerpávající a zachytit téměř veškerý obsah obrázku.""", # Detailed instruction in Czech
             img,
         ]
+        # The image is identified by the SHA256 of the file content
+        cache_path = _ai_cache_path(model_name, prompt_parts[0], file_fingerprint(file_path))
+        cached_output = _get_cached_ai_output(cache_path, f"image {os.path.basename(file_path)}")
+        if cached_output is not None:
+            return cached_output
+
         logging.info(f"Sending request to Gemini API for detailed image description: {os.path.basename(file_path)}")
         response = model.generate_content(prompt_parts)
         logging.debug(f"Raw Gemini API response for image: {response}") # Log raw response for debugging
@@ -1225,6 +2273,7 @@ def get_ai_image_description(file_path, model_name="gemini-1.5-flash-latest"):
                  description = "[AI did not provide a description]"
             else:
                  logging.info(f"Successfully generated detailed image description for {os.path.basename(file_path)}")
+                 _store_ai_output(cache_path, description)
         except ValueError as ve:
             # Handle cases where accessing .text fails (e.g., blocked prompt)
             logging.error(f"Could not extract text from Gemini response for image {os.path.basename(file_path)}. Possible block? Response: {response}. Error: {ve}")
@@ -1281,7 +2330,7 @@ def get_ai_summary(content, model_name="gemini-1.5-flash-latest", max_input_leng
             logging.info(f"Content truncated to {len(content)} characters")
 
         # Use gemini-1.5-flash-latest as requested (efficient model)
-        model = genai.GenerativeModel(model_name)
+        model = _get_gemini_model(model_name)
 
         # Detailed prompt for high accuracy content extraction
         prompt = f"""Zpracuj následující text s maximální přesností (95%+).
@@ -1306,43 +2355,51 @@ def get_ai_summary(content, model_name="gemini-1.5-flash-latest", max_input_leng
             "max_output_tokens": 4096,  # Reduced from 8192 to avoid timeouts
         }
 
-        logging.info(f"Sending request to Gemini API for detailed content extraction")
-
-        # Add retry logic for API calls
-        max_retries = 2
-        retry_delay = 2  # seconds
-
-        for attempt in range(max_retries + 1):
-            try:
-                response = model.generate_content(prompt, generation_config=generation_config)
-                break  # Success, exit retry loop
-            except Exception as retry_error:
-                if attempt < max_retries:
-                    logging.warning(f"API call attempt {attempt+1} failed: {retry_error}. Retrying in {retry_delay} seconds...")
-                    import time
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    # Last attempt failed, re-raise the exception
-                    raise
-
-        if not response.text:
-            logging.warning(f"Gemini API returned empty response for content extraction")
-            return "[AI did not provide any content]"
-
-        logging.info(f"Successfully generated detailed content extraction")
+        cache_path = _ai_cache_path(model_name, prompt, generation_config)
+        response_text = _get_cached_ai_output(cache_path, "content extraction")
+        if response_text is None:
+            response_text = _request_ai_summary(model, prompt, generation_config)
+            if not response_text:
+                logging.warning(f"Gemini API returned empty response for content extraction")
+                return "[AI did not provide any content]"
+            logging.info(f"Successfully generated detailed content extraction")
+            _store_ai_output(cache_path, response_text)
 
         # If content was truncated, add a note
         if original_length > max_input_length:
-            return f"[Poznámka: Původní dokument byl příliš dlouhý ({original_length} znaků), byl zpracován pouze částečný obsah.]\n\n{response.text}"
+            return f"[Poznámka: Původní dokument byl příliš dlouhý ({original_length} znaků), byl zpracován pouze částečný obsah.]\n\n{response_text}"
         else:
-            return response.text
+            return response_text
 
     except Exception as e:
         logging.error(f"Error calling Gemini API ({model_name}): {e}")
         # Consider returning specific error messages based on API response if available
         return f"[AI Processing Error: {e}]"
 
+def _request_ai_summary(model, prompt, generation_config):
+    """Sends the content extraction prompt to Gemini with retries and returns the response text."""
+    logging.info(f"Sending request to Gemini API for detailed content extraction")
+
+    # Add retry logic for API calls
+    max_retries = 2
+    retry_delay = 2  # seconds
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = model.generate_content(prompt, generation_config=generation_config)
+            break  # Success, exit retry loop
+        except Exception as retry_error:
+            if attempt < max_retries:
+                logging.warning(f"API call attempt {attempt+1} failed: {retry_error}. Retrying in {retry_delay} seconds...")
+                import time
+                time.sleep(retry_delay)
+                retry_delay *= 2  # Exponential backoff
+            else:
+                # Last attempt failed, re-raise the exception
+                raise
+
+    return response.text
+
 # --- Main Processing Function ---
 
 def process_file(file_path, max_file_size_mb=50):
@@ -1409,9 +2466,8 @@ def process_file(file_path, max_file_size_mb=50):
             try:
                 # Get total pages in PDF to provide better information
                 try:
-                    with open(file_path, 'rb') as f:
-                        reader = PyPDF2.PdfReader(f)
-                        total_pages = len(reader.pages)
+                    with open_pdf_stream(file_path) as f:
+                        total_pages = pdf_page_count(PyPDF2.PdfReader(f))
                         logging.info(f"PDF has {total_pages} pages in total")
                 except Exception as page_count_err:
                     logging.warning(f"Could not determine total pages in PDF: {page_count_err}")
@@ -1471,18 +2527,9 @@ def process_file(file_path, max_file_size_mb=50):
             # Otevřeme soubor a zkontrolujeme prvních 50 odstavců
             try:
                 doc = docx.Document(file_path)
-                email_indicators = ['Od:', 'Odesílatel:', 'From:', 'Komu:', 'To:', 'Předmět:', 'Subject:']
-                email_indicator_count = 0
-
-                # Zkontrolujeme prvních 50 odstavců (nebo méně, pokud jich je méně)
-                for i in range(min(50, len(doc.paragraphs))):
-                    para_text = doc.paragraphs[i].text
-                    for indicator in email_indicators:
-                        if indicator in para_text:
-                            email_indicator_count += 1
 
-                # Pokud najdeme alespoň 3 indikátory, považujeme to za emailovou korespondenci
-                is_likely_email = email_indicator_count >= 3
+                # Pokud v prvních 50 odstavcích najdeme alespoň 3 indikátory, považujeme to za emailovou korespondenci
+                is_likely_email = looks_like_email_correspondence(doc.paragraphs)
 
                 if is_likely_email:
                     logging.info(f"Document appears to be email correspondence, processing all pages")
@@ -1608,6 +2655,27 @@ def process_file(file_path, max_file_size_mb=50):
     finally:
         return result
 
+def process_files(file_paths, max_file_size_mb=50, max_workers=AI_MAX_CONCURRENT_REQUESTS):
+    """
+    Processes several files concurrently and returns their process_file results in input order.
+
+    Most of the time per file is spent waiting on the Gemini API; those blocking calls release the GIL,
+    so a thread pool overlaps the round trips of up to max_workers files (all sharing one model instance).
+
+    Args:
+        file_paths (list): Paths of the files to process
+        max_file_size_mb (int, optional): Maximum file size in megabytes. Defaults to 50MB.
+        max_workers (int, optional): Maximum number of files processed at once. Defaults to AI_MAX_CONCURRENT_REQUESTS.
+
+    Returns:
+        list: One process_file result dictionary per file
+    """
+    file_paths = list(file_paths)
+    if len(file_paths) <= 1 or max_workers <= 1:
+        return [process_file(file_path, max_file_size_mb) for file_path in file_paths]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(file_paths)), thread_name_prefix='process-files') as files_executor:
+        return list(files_executor.map(functools.partial(process_file, max_file_size_mb=max_file_size_mb), file_paths))
+
 # Example Usage (for testing)
 if __name__ == '__main__':
     # Create dummy files for testing
@@ -6,7 +6,9 @@ které lze zpracovat postupně. Podporuje různé typy souborů včetně PDF, DO
 """
 
 import os
+import codecs
 import logging
+import mmap
 import uuid
 import shutil
 import PyPDF2
@@ -18,7 +20,7 @@ logger = logging.getLogger(__name__)
 
 # Konstanty
 DEFAULT_CHUNK_SIZE = 5  # Počet stránek na jeden chunk pro PDF
-DEFAULT_TEXT_CHUNK_SIZE = 50000  # Počet znaků na jeden chunk pro textové soubory
+DEFAULT_TEXT_CHUNK_SIZE = 50000  # Počet bajtů na jeden chunk pro textové soubory (u ASCII textu = znaků)
 MAX_FILE_SIZE_MB = 10  # Maximální velikost souboru v MB, nad kterou se soubor rozdělí
 
 def should_split_file(file_path, max_size_mb=MAX_FILE_SIZE_MB):
@@ -147,14 +149,41 @@ def split_pdf_file(file_path, split_folder, chunk_size=DEFAULT_CHUNK_SIZE):
         logger.error(f"Chyba při rozdělování PDF {file_path}: {e}")
         raise
 
+def utf8_chunk_boundaries(data, chunk_size):
+    """
+    Rozdělí data na úseky o přibližně chunk_size bajtech tak, aby hranice nepřeťala vícebajtový UTF-8 znak.
+
+    Args:
+        data: Data podporující len() a indexování po bajtech (bytes, mmap)
+        chunk_size (int): Požadovaná velikost úseku v bajtech
+
+    Returns:
+        list: Seznam dvojic (začátek, konec) jednotlivých úseků
+    """
+    boundaries = []
+    size = len(data)
+    start = 0
+    while start < size:
+        end = min(start + chunk_size, size)
+        # Hranici posuneme před pokračovací bajty (10xxxxxx) rozděleného znaku
+        while end < size and end > start + 1 and data[end] & 0xC0 == 0x80:
+            end -= 1
+        boundaries.append((start, end))
+        start = end
+    return boundaries
+
 def split_text_file(file_path, split_folder, chunk_size=DEFAULT_TEXT_CHUNK_SIZE):
     """
     Rozdělí textový soubor na menší části.
 
+    Soubor se namapuje do paměti (mmap), hranice částí se spočítají předem po bajtech
+    (na hranicích UTF-8 znaků) a každá část se zapíše přímo z mapované paměti - bez
+    dekódování celého souboru a bez přejmenovávání částí podle skutečného počtu.
+
     Args:
         file_path (str): Cesta k textovému souboru
         split_folder (str): Složka pro uložení rozdělených částí
-        chunk_size (int): Počet znaků na jeden chunk
+        chunk_size (int): Přibližný počet bajtů na jeden chunk
 
     Returns:
         list: Seznam cest k rozděleným částem
@@ -164,56 +193,76 @@ def split_text_file(file_path, split_folder, chunk_size=DEFAULT_TEXT_CHUNK_SIZE)
     extension = os.path.splitext(original_filename)[1]
 
     try:
-        # Získáme velikost souboru pro odhad počtu částí
-        file_size = os.path.getsize(file_path)
-        estimated_num_chunks = (file_size + (chunk_size * 2) - 1) // (chunk_size * 2)  # Odhadovaný počet částí (s rezervou)
+        # Prázdný soubor nelze namapovat (a není co dělit)
+        if os.path.getsize(file_path) == 0:
+            return [], 0
 
-        # Vytvoření částí - optimalizovaná verze, která nečte celý soubor najednou
         part_files = []
-        chunk_index = 0
-
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            while True:
-                # Čteme jen část souboru najednou
-                chunk_content = f.read(chunk_size)
-
-                # Pokud jsme na konci souboru, končíme
-                if not chunk_content:
-                    break
-
-                # Uložení části
-                part_filename = f"{base_name}_part{chunk_index+1}of{estimated_num_chunks}{extension}"
-                part_path = os.path.join(split_folder, part_filename)
-
-                with open(part_path, 'w', encoding='utf-8') as part_file:
-                    part_file.write(chunk_content)
-
-                part_files.append(part_path)
-                logger.info(f"Vytvořena část {chunk_index+1}: {part_path} (přibližně {chunk_size} znaků)")
-
-                chunk_index += 1
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            boundaries = utf8_chunk_boundaries(mapped, chunk_size)
+            num_chunks = len(boundaries)
+
+            with memoryview(mapped) as view:
+                for i, (start, end) in enumerate(boundaries):
+                    part_filename = f"{base_name}_part{i+1}of{num_chunks}{extension}"
+                    part_path = os.path.join(split_folder, part_filename)
+
+                    with view[start:end] as chunk_view:
+                        part_data = chunk_view
+                        try:
+                            # Části se čtou jako UTF-8 - ověříme, že úsek je platný
+                            codecs.utf_8_decode(chunk_view, 'strict', True)
+                        except UnicodeDecodeError:
+                            # Neplatné UTF-8 sekvence vynecháme (stejně jako errors='ignore' při čtení)
+                            part_data = bytes(chunk_view).decode('utf-8', errors='ignore').encode('utf-8')
+
+                        with open(part_path, 'wb') as part_file:
+                            part_file.write(part_data)
+
+                    part_files.append(part_path)
+                    logger.info(f"Vytvořena část {i+1}/{num_chunks}: {part_path} ({end - start} bajtů)")
 
-        # Aktualizujeme názvy souborů, pokud se počet částí liší od odhadu
-        if chunk_index != estimated_num_chunks:
-            updated_part_files = []
-            for i, old_path in enumerate(part_files):
-                # Vytvoříme nový název souboru se správným počtem částí
-                new_filename = f"{base_name}_part{i+1}of{chunk_index}{extension}"
-                new_path = os.path.join(split_folder, new_filename)
-
-                # Přejmenujeme soubor
-                os.rename(old_path, new_path)
-                updated_part_files.append(new_path)
-                logger.info(f"Přejmenována část {i+1}: {old_path} -> {new_path}")
-
-            part_files = updated_part_files
-
-        return part_files, chunk_index
+        return part_files, num_chunks
 
     except Exception as e:
         logger.error(f"Chyba při rozdělování textového souboru {file_path}: {e}")
         raise
 
+def copy_byte_range(src, dst, offset, length, buffer_size):
+    """
+    Zkopíruje úsek souboru src do souboru dst (od jeho aktuální pozice).
+
+    Na Linuxu se použije os.copy_file_range - data kopíruje jádro bez průchodu přes
+    buffery v Pythonu (na souborových systémech s reflinky i bez fyzického kopírování).
+    Pokud není k dispozici nebo selže, kopíruje se klasicky po blocích.
+
+    Args:
+        src: Zdrojový soubor otevřený v binárním režimu
+        dst: Cílový soubor otevřený v binárním režimu pro zápis
+        offset (int): Pozice začátku úseku ve zdrojovém souboru
+        length (int): Počet bajtů ke zkopírování
+        buffer_size (int): Velikost bufferu pro klasické kopírování
+    """
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while length > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), length, offset)
+                if copied == 0:  # Konec souboru
+                    return
+                offset += copied
+                length -= copied
+            return
+        except OSError as e:
+            logger.debug(f"copy_file_range není k dispozici ({e}), kopíruji po blocích")
+
+    src.seek(offset)
+    while length > 0:
+        chunk_data = src.read(min(buffer_size, length))
+        if not chunk_data:  # Konec souboru
+            break
+        dst.write(chunk_data)
+        length -= len(chunk_data)
+
 def split_binary_file(file_path, split_folder, chunk_size_mb=5):
     """
     Rozdělí binární soubor na menší části.
@@ -251,17 +300,12 @@ def split_binary_file(file_path, split_folder, chunk_size_mb=5):
 
                 # Otevřeme výstupní soubor
                 with open(part_path, 'wb') as part_file:
-                    # Určíme, kolik dat máme přečíst pro tento chunk
-                    bytes_remaining = min(chunk_size_bytes, file_size - (i * chunk_size_bytes))
-
-                    # Čteme a zapisujeme po částech, abychom šetřili paměť
-                    while bytes_remaining > 0:
-                        read_size = min(buffer_size, bytes_remaining)
-                        chunk_data = f.read(read_size)
-                        if not chunk_data:  # Konec souboru
-                            break
-                        part_file.write(chunk_data)
-                        bytes_remaining -= len(chunk_data)
+                    # Určíme, kolik dat máme zkopírovat pro tento chunk
+                    offset = i * chunk_size_bytes
+                    bytes_remaining = min(chunk_size_bytes, file_size - offset)
+
+                    # Kopírujeme úsek v jádře, případně po částech, abychom šetřili paměť
+                    copy_byte_range(f, part_file, offset, bytes_remaining, buffer_size)
 
                 part_files.append(part_path)
                 logger.info(f"Vytvořena část {i+1}/{num_chunks}: {part_path}")
@@ -314,12 +358,15 @@ def cleanup_split_folder(split_folder):
     Args:
         split_folder (str): Cesta ke složce s rozdělenými částmi
     """
-    if split_folder and os.path.exists(split_folder):
-        try:
-            shutil.rmtree(split_folder)
-            logger.info(f"Složka s rozdělenými částmi byla vyčištěna: {split_folder}")
-        except Exception as e:
-            logger.error(f"Chyba při čištění složky {split_folder}: {e}")
+    if not split_folder:
+        return
+    try:
+        shutil.rmtree(split_folder)
+        logger.info(f"Složka s rozdělenými částmi byla vyčištěna: {split_folder}")
+    except FileNotFoundError:
+        pass  # Složka již neexistuje
+    except Exception as e:
+        logger.error(f"Chyba při čištění složky {split_folder}: {e}")
 
 def cleanup_temp_files(upload_folder, max_age_hours=24):
     """
@@ -335,15 +382,20 @@ def cleanup_temp_files(upload_folder, max_age_hours=24):
     current_time = time.time()
     max_age_seconds = max_age_hours * 3600
 
-    # Procházíme všechny soubory a složky v upload_folder
+    # Procházíme všechny soubory a složky v upload_folder - os.scandir vrací typ položky
+    # bez dalšího stat() a čas změny zjišťujeme jen u kandidátů na smazání
     try:
-        for item in os.listdir(upload_folder):
-            item_path = os.path.join(upload_folder, item)
+        with os.scandir(upload_folder) as entries:
+            items = list(entries)
+
+        for entry in items:
+            item = entry.name
+            item_path = entry.path
 
             # Kontrola, zda je to složka s rozdělenými soubory
-            if os.path.isdir(item_path) and item.startswith('split_'):
+            if item.startswith('split_') and entry.is_dir(follow_symlinks=False):
                 # Zjistíme stáří složky
-                item_age = current_time - os.path.getmtime(item_path)
+                item_age = current_time - entry.stat(follow_symlinks=False).st_mtime
 
                 # Pokud je složka starší než max_age_seconds, smažeme ji
                 if item_age > max_age_seconds:
@@ -354,14 +406,14 @@ def cleanup_temp_files(upload_folder, max_age_hours=24):
                         logger.error(f"Chyba při čištění staré složky {item_path}: {e}")
 
             # Kontrola, zda je to dočasný soubor
-            elif os.path.isfile(item_path) and (item.startswith('temp_') or '_part' in item):
+            elif (item.startswith('temp_') or '_part' in item) and entry.is_file(follow_symlinks=False):
                 # Zjistíme stáří souboru
-                item_age = current_time - os.path.getmtime(item_path)
+                item_age = current_time - entry.stat(follow_symlinks=False).st_mtime
 
                 # Pokud je soubor starší než max_age_seconds, smažeme ho
                 if item_age > max_age_seconds:
                     try:
-                        os.remove(item_path)
+                        os.unlink(item_path)
                         logger.info(f"Vyčištěn starý dočasný soubor: {item_path} (stáří: {item_age/3600:.1f} hodin)")
                     except Exception as e:
                         logger.error(f"Chyba při čištění starého souboru {item_path}: {e}")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Test script for the on-disk parse cache (cache hits, invalidation, failed parses and pruning).
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import shutil
+
+import PyPDF2
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Import the parsing functions from the convertor module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from convertor import core
+from convertor.core import parse_csv_file, parse_pdf_file, cached_parse, prune_cache
+
+# Create a temporary directory for test files
+test_dir = tempfile.mkdtemp()
+logger.info(f"Created temporary test directory: {test_dir}")
+
+def cleanup():
+    """Clean up temporary test files."""
+    try:
+        shutil.rmtree(test_dir)
+        logger.info(f"Removed temporary test directory: {test_dir}")
+    except Exception as e:
+        logger.error(f"Error cleaning up test directory: {e}")
+
+def use_fresh_cache(name):
+    """Points the parse cache at an empty directory of its own and returns its path."""
+    cache_dir = os.path.join(test_dir, f"cache_{name}")
+    core.PARSE_CACHE_DIR = cache_dir
+    core.PARSE_CACHE_ENABLED = True
+    return cache_dir
+
+def cache_entries(cache_dir):
+    """Returns the cache files currently stored in cache_dir."""
+    if not os.path.isdir(cache_dir):
+        return []
+    return [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(core.PARSE_CACHE_SUFFIX)]
+
+def write_csv(file_path, rows):
+    with open(file_path, "w") as f:
+        f.write("name,age\n")
+        for name, age in rows:
+            f.write(f"{name},{age}\n")
+
+def test_cache_hit():
+    """The second parse of an unchanged file returns the cached text."""
+    cache_dir = use_fresh_cache("hit")
+    file_path = os.path.join(test_dir, "hit.csv")
+    write_csv(file_path, [("John Doe", 30), ("Jane Smith", 25)])
+
+    content = parse_csv_file(file_path)
+    assert "John Doe" in content, "CSV content not found"
+    entries = cache_entries(cache_dir)
+    assert len(entries) == 1, f"Expected one cache entry, found {len(entries)}"
+
+    # Overwrite the entry - a cache hit must return it instead of re-parsing the file
+    core._write_cache_file(entries[0], "cached text")
+    assert parse_csv_file(file_path) == "cached text", "Cached text was not used"
+    return True
+
+def test_cache_miss_after_change():
+    """Changing the file content changes the cache key, so the file is parsed again."""
+    cache_dir = use_fresh_cache("change")
+    file_path = os.path.join(test_dir, "change.csv")
+    write_csv(file_path, [("John Doe", 30)])
+    assert "John Doe" in parse_csv_file(file_path), "CSV content not found"
+
+    write_csv(file_path, [("Jürgen Müller", 41), ("Jane Smith", 25)])
+    content = parse_csv_file(file_path)
+    assert "Jürgen Müller" in content and "John Doe" not in content, "Stale cached text returned after file change"
+    assert len(cache_entries(cache_dir)) == 2, "Changed file was not cached under a new key"
+    return True
+
+def test_no_cache_for_empty_parse():
+    """A PDF without any text layer parsed without OCR yields '' and must not be cached."""
+    cache_dir = use_fresh_cache("empty")
+    file_path = os.path.join(test_dir, "blank.pdf")
+    writer = PyPDF2.PdfWriter()
+    writer.add_blank_page(width=200, height=200)
+    with open(file_path, "wb") as f:
+        writer.write(f)
+
+    assert parse_pdf_file(file_path, try_ocr=False).strip() == "", "Blank PDF unexpectedly produced text"
+    assert cache_entries(cache_dir) == [], "Empty parse result was cached"
+    return True
+
+def test_no_cache_for_failed_step():
+    """A parser that skipped a failed step (_mark_parse_uncacheable) is not cached and runs again next time."""
+    cache_dir = use_fresh_cache("failed")
+    file_path = os.path.join(test_dir, "failed.csv")
+    write_csv(file_path, [("John Doe", 30)])
+    calls = []
+
+    @cached_parse("test")
+    def parse_with_failed_page(path):
+        calls.append(path)
+        core._mark_parse_uncacheable()
+        return "partial text"
+
+    assert parse_with_failed_page(file_path) == "partial text"
+    assert parse_with_failed_page(file_path) == "partial text"
+    assert len(calls) == 2, "Partial parse result was served from the cache"
+    assert cache_entries(cache_dir) == [], "Partial parse result was cached"
+    return True
+
+def test_prune_cache():
+    """prune_cache() removes entries older than the age limit and the oldest ones over the size limit."""
+    cache_dir = use_fresh_cache("prune")
+    now = time.time()
+    for index, age_days in enumerate([40, 3, 2, 1]):
+        path = os.path.join(cache_dir, f"entry{index}{core.PARSE_CACHE_SUFFIX}")
+        core._write_cache_file(path, "x" * 1000)
+        mtime = now - age_days * 24 * 60 * 60
+        os.utime(path, (mtime, mtime))
+
+    assert prune_cache(max_age_days=30, max_size_mb=100) == 1, "Old entry was not pruned"
+    remaining = sorted(os.path.basename(path) for path in cache_entries(cache_dir))
+    assert remaining == [f"entry{i}{core.PARSE_CACHE_SUFFIX}" for i in (1, 2, 3)], remaining
+
+    # A tiny size limit keeps only the most recently used entry
+    entry_size = os.path.getsize(os.path.join(cache_dir, remaining[-1]))
+    assert prune_cache(max_age_days=30, max_size_mb=entry_size / (1024 * 1024)) == 2, "Size limit was not applied"
+    assert [os.path.basename(path) for path in cache_entries(cache_dir)] == [f"entry3{core.PARSE_CACHE_SUFFIX}"]
+    return True
+
+def run_tests():
+    """Run all tests and report results."""
+    tests = [
+        ("Cache hit", test_cache_hit),
+        ("Cache miss after file change", test_cache_miss_after_change),
+        ("No caching of empty parse", test_no_cache_for_empty_parse),
+        ("No caching of failed parse step", test_no_cache_for_failed_step),
+        ("Cache pruning", test_prune_cache),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        logger.info(f"Running test: {test_name}")
+        try:
+            success = test_func()
+        except Exception as e:
+            logger.error(f"Error in {test_name}: {e}")
+            success = False
+        results.append((test_name, success))
+        logger.info(f"Test {test_name}: {'PASSED' if success else 'FAILED'}")
+
+    # Print summary
+    print("\n=== Test Results ===")
+    passed = 0
+    for test_name, success in results:
+        status = "PASSED" if success else "FAILED"
+        print(f"{test_name}: {status}")
+        if success:
+            passed += 1
+
+    print(f"\nPassed: {passed}/{len(results)} tests")
+    return passed == len(results)
+
+if __name__ == "__main__":
+    try:
+        success = run_tests()
+        sys.exit(0 if success else 1)
+    finally:
+        cleanup()
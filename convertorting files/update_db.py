@@ -1,5 +1,6 @@
 from app import app
 import os
+import json
 import sqlite3
 
 # Přidání sloupce content_type do tabulky user_document
@@ -32,6 +33,57 @@ with app.app_context():
     except sqlite3.OperationalError as e:
         print(f"Sloupec tags již existuje nebo nastala chyba: {e}")
 
+    # Převod tagů z textu odděleného čárkami na JSON pole (sloupec tags je v modelu typu JSON)
+    cursor.execute("SELECT id, tags FROM user_document WHERE tags IS NOT NULL AND tags NOT LIKE '[%'")
+    legacy_tags = cursor.fetchall()
+    cursor.executemany(
+        'UPDATE user_document SET tags = ? WHERE id = ?',
+        [(json.dumps(tags.split(',') if tags else [], ensure_ascii=False), doc_id) for doc_id, tags in legacy_tags]
+    )
+    print(f"Tagy převedeny na JSON pro {len(legacy_tags)} dokumentů.")
+
+    # Přidání sloupce content_hash pro deduplikaci nahraných souborů
+    try:
+        cursor.execute('ALTER TABLE user_document ADD COLUMN content_hash VARCHAR(64)')
+        print("Sloupec content_hash byl přidán.")
+    except sqlite3.OperationalError as e:
+        print(f"Sloupec content_hash již existuje nebo nastala chyba: {e}")
+
+    # Přidání sloupce content_preview (zkrácený obsah pro výpisy) a jeho naplnění pro existující dokumenty
+    try:
+        cursor.execute('ALTER TABLE user_document ADD COLUMN content_preview VARCHAR(203)')
+        print("Sloupec content_preview byl přidán.")
+    except sqlite3.OperationalError as e:
+        print(f"Sloupec content_preview již existuje nebo nastala chyba: {e}")
+    cursor.execute('''
+        UPDATE user_document
+        SET content_preview = CASE WHEN length(processed_content) > 200
+                                   THEN substr(processed_content, 1, 200) || '...'
+                                   ELSE processed_content END
+        WHERE content_preview IS NULL AND processed_content IS NOT NULL AND processed_content != ''
+    ''')
+    print(f"Náhled obsahu doplněn pro {cursor.rowcount} dokumentů.")
+
+    # Přidání indexů (cizí klíče, hash obsahu a složené indexy pro výpis dokumentů).
+    # Sloupce přidané přes ALTER TABLE své indexy z modelu nedostanou - db.create_all() existující tabulku nemění.
+    composite_indexes = [
+        ('ix_user_document_parent_id', 'parent_id'),
+        ('ix_user_document_folder_id', 'folder_id'),
+        ('ix_user_document_content_hash', 'content_hash'),
+        ('ix_user_document_list', 'parent_id, folder_id, upload_time'),
+        ('ix_user_document_parent_time', 'parent_id, upload_time'),
+        ('ix_user_document_status_time', 'status, upload_time'),
+        ('ix_user_document_content_type_time', 'content_type, upload_time'),
+        ('ix_user_document_folder_time', 'folder_id, upload_time'),
+        ('ix_user_document_parent_part', 'parent_id, part_number'),
+    ]
+    for index_name, columns in composite_indexes:
+        try:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON user_document ({columns})')
+            print(f"Index {index_name} byl vytvořen.")
+        except sqlite3.OperationalError as e:
+            print(f"Index {index_name} nelze vytvořit: {e}")
+
     # Uložení změn
     conn.commit()
     conn.close()
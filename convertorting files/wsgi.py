@@ -0,0 +1,10 @@
+"""
+WSGI vstupní bod pro produkční server (např. `gunicorn wsgi:app`).
+
+Inicializace databáze neprobíhá při importu app.py - workery process poolu modul při 'spawn'
+importují znovu a do databáze sahat nemají. Tady ji proto spouštíme explicitně, stejně jako
+blok __main__ v app.py.
+"""
+from app import app, init_default_folders
+
+init_default_folders()